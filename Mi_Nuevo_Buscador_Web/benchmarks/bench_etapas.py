@@ -0,0 +1,309 @@
+"""
+bench_etapas.py
+
+Suite de benchmarks del buscador: mide por separado cada etapa (carga del
+Excel, sidecar, índice, filtros, orden, agrupación, exportación) y las
+rutas de Flask de punta a punta (con el cliente de pruebas), sobre libros
+de facturas sintéticos de 10k, 100k y 1M filas (ver generar_facturas.py).
+
+Para cada etapa se guarda el tiempo (mínimo y mediana de las repeticiones)
+y el pico de memoria (RSS) del proceso. Cada tamaño corre en un proceso
+nuevo, para que el pico de un tamaño no se mezcle con el del siguiente.
+El reporte es un JSON; con --comparar se marcan las etapas que se volvieron
+más lentas que en un reporte anterior (y el programa termina con código 1).
+
+Las rutas se miden con la caché de resultados desactivada (cada petición
+calcula de verdad); el dataset sí queda cargado en memoria tras el upload.
+
+Uso (desde la carpeta Mi_Nuevo_Buscador_Web):
+    python benchmarks/bench_etapas.py                              # 10k, 100k y 1M filas
+    python benchmarks/bench_etapas.py --tamanos 10000 --salida base.json
+    python benchmarks/bench_etapas.py --tamanos 10000 --comparar base.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# resource solo existe en Unix (en Windows no se mide la memoria)
+try:
+    import resource
+except ImportError:
+    resource = None
+
+CARPETA_APP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CARPETA_APP)
+
+from generar_facturas import generar_libro, CARPETA_CACHE  # noqa: E402
+
+TAMANOS = (10_000, 100_000, 1_000_000)
+VERSION_REPORTE = 1
+
+# Una etapa es regresión si su mediana crece más que el umbral Y más que este mínimo (ruido)
+MINIMO_REGRESION_SEGUNDOS = 0.005
+
+
+def rss_pico_mb():
+    """Pico de memoria residente del proceso hasta ahora (MB), o None sin `resource`."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB; macOS en bytes
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+
+class Medidor:
+    """Mide etapas y junta sus resultados para el reporte."""
+
+    def __init__(self, repeticiones: int):
+        self.repeticiones = repeticiones
+        self.etapas = {}
+
+    def medir(self, nombre: str, funcion, repeticiones: int = None):
+        """
+        Ejecuta `funcion` varias veces y guarda el tiempo y la memoria.
+
+        Returns:
+            El resultado de la última ejecución.
+        """
+        repeticiones = repeticiones or self.repeticiones
+        pico_antes = rss_pico_mb()
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            resultado = funcion()
+            tiempos.append(time.perf_counter() - inicio)
+        pico = rss_pico_mb()
+
+        self.etapas[nombre] = {
+            'segundos_min': min(tiempos),
+            'segundos_mediana': statistics.median(tiempos),
+            'repeticiones': repeticiones,
+            'rss_pico_mb': pico,
+            'rss_incremento_mb': (pico - pico_antes) if pico is not None else None,
+        }
+        print(f"  {nombre:<32} {statistics.median(tiempos) * 1000:10.1f} ms"
+              + (f"  pico {pico:8.1f} MB" if pico is not None else ""), file=sys.stderr)
+        return resultado
+
+
+def _consumir(generador) -> int:
+    """Recorre un generador de bytes (exportación) y devuelve el tamaño total."""
+    return sum(len(trozo) for trozo in generador)
+
+
+def medir_etapas(medidor: Medidor, ruta_excel: str, carpeta: str):
+    """Cada etapa por separado, llamando directamente a los módulos."""
+    from modules.loader import cargar_datos, compactar_datos
+    from modules.search_index import IndiceBusqueda
+    from modules.filters import normalizar_filtros, filtrar_posiciones, mascara_busqueda_rapida
+    from modules.pagination import ordenar_posiciones
+    from modules.aggregation import agrupar
+    from modules.exporter import exportar
+    from modules.montos import convertir_montos
+
+    import numpy as np
+
+    # Carga: el Excel siempre se parsea una sola vez (es la etapa más cara)
+    df = medidor.medir('carga_excel', lambda: cargar_datos(ruta_excel, usar_sidecar=False), 1)
+    copia = os.path.join(carpeta, 'etapas.xlsx')
+    shutil.copyfile(ruta_excel, copia)
+    medidor.medir('carga_excel_y_sidecar', lambda: cargar_datos(copia), 1)
+    df = medidor.medir('carga_sidecar', lambda: cargar_datos(copia))
+    medidor.medir('compactar', lambda: compactar_datos(df), 1)
+
+    filtro_texto = normalizar_filtros([{'columna': 'Vendor Name', 'valor': '0001'}])
+    filtros_tipados = normalizar_filtros([
+        {'columna': 'Total', 'op': 'gt', 'valor': '5000'},
+        {'columna': 'Status', 'op': 'in', 'valor': ['paid', 'approved']},
+        {'columna': 'Invoice Date', 'op': 'date_between', 'valor': ['2024-01-01', '2024-06-30']},
+    ])
+    medidor.medir('filtro_contains_sin_indice', lambda: filtrar_posiciones(df, filtro_texto))
+
+    def construir_indice():
+        indice = IndiceBusqueda(df)
+        for columna in ('Vendor Name', 'Status', 'Total', 'Invoice Date'):
+            indice.columna(columna)
+        return indice
+    indice = medidor.medir('indice_construccion', construir_indice, 1)
+    medidor.medir('filtro_contains_indice', lambda: filtrar_posiciones(df, filtro_texto, indice=indice))
+    medidor.medir('filtro_tipado', lambda: filtrar_posiciones(df, filtros_tipados, indice=indice))
+    medidor.medir('busqueda_rapida', lambda: mascara_busqueda_rapida(df, 'proveedor 00012', None, indice))
+
+    montos = medidor.medir('montos_a_numero', lambda: convertir_montos(df['Total']).to_numpy(dtype=float))
+    todas = np.arange(len(df))
+    medidor.medir('ordenar_texto', lambda: ordenar_posiciones(df, todas, 'Vendor Name', 'asc'))
+    medidor.medir('ordenar_monto', lambda: ordenar_posiciones(df, todas, 'Total', 'desc', 'Total', montos))
+
+    medidor.medir('agrupar_proveedor', lambda: agrupar(df, 'Vendor Name', valores_numericos={'Total': montos}))
+    medidor.medir('agrupar_estado_tipo', lambda: agrupar(df, ['Status', 'Document Type'], valores_numericos={'Total': montos}))
+
+    medidor.medir('exportar_csv', lambda: _consumir(exportar(df, 'csv')[0]), 1)
+    medidor.medir('exportar_xlsx', lambda: _consumir(exportar(df, 'xlsx')[0]), 1)
+
+
+def medir_rutas(medidor: Medidor, ruta_excel: str, carpeta: str):
+    """Las rutas de Flask de punta a punta, con el cliente de pruebas."""
+    # La configuración de app.py se lee del entorno al importarla
+    os.environ['BUSCADOR_UPLOAD_FOLDER'] = os.path.join(carpeta, 'uploads')
+    os.environ['BUSCADOR_CACHE_RESULTADOS_MB'] = '0'
+    os.environ['BUSCADOR_LOG_PETICIONES'] = '0'
+    import app as aplicacion
+    cliente = aplicacion.app.test_client()
+
+    def post(url, datos):
+        respuesta = cliente.post(url, json=datos)
+        if respuesta.status_code != 200:
+            raise RuntimeError(f"{url}: {respuesta.status_code} {respuesta.get_data(as_text=True)[:200]}")
+        return respuesta
+
+    def subir():
+        with open(ruta_excel, 'rb') as archivo:
+            file_id = cliente.post('/api/upload', data={'file': (archivo, 'facturas.xlsx')}).get_json()['file_id']
+        while cliente.get(f'/api/upload_status/{file_id}').get_json()['estado'] not in ('listo', 'error'):
+            time.sleep(0.05)
+        return file_id
+    file_id = medidor.medir('ruta_upload_e_ingesta', subir, 1)
+
+    filtros = [{'columna': 'Status', 'op': 'eq', 'valor': 'paid'}, {'columna': 'Vendor Name', 'valor': '00'}]
+    medidor.medir('ruta_filter_primera_pagina', lambda: post(
+        '/api/filter?formato=columnar', {'file_id': file_id, 'filtros_activos': [], 'limit': 200}))
+    medidor.medir('ruta_filter_ordenado', lambda: post('/api/filter?formato=columnar', {
+        'file_id': file_id, 'filtros_activos': filtros, 'limit': 200,
+        'sort_column': 'Total', 'sort_direction': 'desc', 'busqueda': 'unidad operativa 1'}))
+    medidor.medir('ruta_filter_summary_only', lambda: post('/api/filter', {
+        'file_id': file_id, 'filtros_activos': filtros, 'summary_only': True, 'percentiles': [50, 90]}))
+    medidor.medir('ruta_group_by', lambda: post('/api/group_by?formato=columnar', {
+        'file_id': file_id, 'filtros_activos': filtros, 'columna_agrupar': 'Vendor Name'}))
+    medidor.medir('ruta_column_values', lambda: post('/api/column_values', {
+        'file_id': file_id, 'columna': 'Invoice #', 'prefijo': 'inv-0000', 'limite': 20}))
+    medidor.medir('ruta_download_csv', lambda: len(post('/api/download_excel', {
+        'file_id': file_id, 'filtros_activos': filtros, 'formato': 'csv'}).get_data()), 1)
+    medidor.medir('ruta_download_xlsx', lambda: len(post('/api/download_excel', {
+        'file_id': file_id, 'filtros_activos': filtros, 'formato': 'xlsx'}).get_data()), 1)
+
+
+def medir_tamano(filas: int, repeticiones: int, carpeta_cache: str) -> dict:
+    """Todas las mediciones de un tamaño (se llama en un proceso aparte)."""
+    ruta_excel = generar_libro(filas, carpeta=carpeta_cache)
+    medidor = Medidor(repeticiones)
+    with tempfile.TemporaryDirectory() as carpeta:
+        print(f"{filas} filas ({os.path.getsize(ruta_excel) / 1024 / 1024:.1f} MB):", file=sys.stderr)
+        medir_etapas(medidor, ruta_excel, carpeta)
+        medir_rutas(medidor, ruta_excel, carpeta)
+    return {
+        'filas': filas,
+        'bytes_excel': os.path.getsize(ruta_excel),
+        'rss_pico_mb': rss_pico_mb(),
+        'etapas': medidor.etapas,
+    }
+
+
+def entorno() -> dict:
+    """Versiones y máquina, para saber si dos reportes son comparables."""
+    import numpy as np
+    import pandas as pd
+    try:
+        import pyarrow
+        version_arrow = pyarrow.__version__
+    except ImportError:
+        version_arrow = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=CARPETA_APP,
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'pyarrow': version_arrow,
+        'plataforma': platform.platform(),
+        'nucleos': os.cpu_count(),
+        'commit': commit,
+    }
+
+
+def comparar(reporte: dict, base: dict, umbral: float) -> list:
+    """Etapas cuya mediana creció más que `umbral` (ej. 0.2 = 20 %) respecto a `base`."""
+    regresiones = []
+    for tamano, resultado in reporte['resultados'].items():
+        etapas_base = base.get('resultados', {}).get(tamano, {}).get('etapas', {})
+        for nombre, medida in resultado['etapas'].items():
+            anterior = etapas_base.get(nombre)
+            if anterior is None:
+                continue
+            antes, ahora = anterior['segundos_mediana'], medida['segundos_mediana']
+            if ahora > antes * (1 + umbral) and ahora - antes > MINIMO_REGRESION_SEGUNDOS:
+                regresiones.append((tamano, nombre, antes, ahora))
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tamanos', default=','.join(str(t) for t in TAMANOS), help="Filas, separadas por comas")
+    parser.add_argument('--repeticiones', type=int, default=3, help="Repeticiones de las etapas baratas")
+    parser.add_argument('--salida', default=None, help="Ruta del reporte JSON (por defecto, bench_<fecha>.json)")
+    parser.add_argument('--comparar', default=None, help="Reporte anterior con el que comparar")
+    parser.add_argument('--umbral', type=float, default=0.2, help="Crecimiento que cuenta como regresión (0.2 = 20 %%)")
+    parser.add_argument('--carpeta-cache', default=CARPETA_CACHE, help="Dónde se guardan los libros generados")
+    parser.add_argument('--interno', type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--resultado-interno', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.interno is not None:
+        # Proceso hijo: mide un solo tamaño y deja el resultado en un archivo
+        resultado = medir_tamano(args.interno, args.repeticiones, args.carpeta_cache)
+        with open(args.resultado_interno, 'w', encoding='utf-8') as archivo:
+            json.dump(resultado, archivo)
+        return
+
+    reporte = {
+        'version': VERSION_REPORTE,
+        'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+        'entorno': entorno(),
+        'repeticiones': args.repeticiones,
+        'resultados': {},
+    }
+    for filas in (int(t) for t in args.tamanos.split(',')):
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as temporal:
+            ruta_resultado = temporal.name
+        try:
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--interno', str(filas),
+                 '--resultado-interno', ruta_resultado, '--repeticiones', str(args.repeticiones),
+                 '--carpeta-cache', args.carpeta_cache],
+                check=True, stdout=subprocess.DEVNULL  # Los avisos de carga van a stdout
+            )
+            with open(ruta_resultado, encoding='utf-8') as archivo:
+                reporte['resultados'][str(filas)] = json.load(archivo)
+        finally:
+            os.remove(ruta_resultado)
+
+    salida = args.salida or f"bench_{datetime.datetime.now():%Y%m%d_%H%M%S}.json"
+    with open(salida, 'w', encoding='utf-8') as archivo:
+        json.dump(reporte, archivo, indent=2)
+    print(f"Reporte: {salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            base = json.load(archivo)
+        regresiones = comparar(reporte, base, args.umbral)
+        for tamano, nombre, antes, ahora in regresiones:
+            print(f"  REGRESIÓN {tamano:>8} filas  {nombre:<32} {antes * 1000:9.1f} -> {ahora * 1000:9.1f} ms "
+                  f"(x{ahora / antes:.2f})")
+        if regresiones:
+            sys.exit(1)
+        print("Sin regresiones respecto a", args.comparar)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+bench_serializacion.py
+
+Compara el tiempo de codificación y el tamaño de la respuesta de
+/api/filter con el formato clásico (to_dict + jsonify) y con el
+formato columnar (?formato=columnar).
+
+Uso (desde la carpeta Mi_Nuevo_Buscador_Web):
+    python benchmarks/bench_serializacion.py --filas 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify  # noqa: E402
+from modules.serializer import json_columnar  # noqa: E402
+
+
+def generar_df(filas: int) -> pd.DataFrame:
+    """DataFrame de texto parecido al que devuelve cargar_datos."""
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "Invoice #": [f"INV-{i:07d}" for i in range(filas)],
+        "Vendor Name": [f"Proveedor {v}" for v in rng.integers(0, 5000, filas)],
+        "Status": rng.choice(["Pending", "Paid", "Rejected"], filas),
+        "Total": [f"${v:,.2f}" for v in rng.uniform(0, 100000, filas)],
+        "Invoice Date": rng.choice(pd.date_range("2024-01-01", periods=365).strftime("%Y-%m-%d"), filas),
+        "_row_status": rng.choice(["Completo", "Incompleto"], filas),
+    })
+
+
+def medir(funcion, repeticiones: int):
+    """Devuelve (mejor tiempo en segundos, bytes de la respuesta)."""
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        cuerpo = funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor, len(cuerpo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=100_000)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    df = generar_df(args.filas)
+    app = Flask(__name__)
+
+    def clasico():
+        with app.app_context():
+            return jsonify({"data": df.to_dict(orient="records"), "num_filas": len(df)}).get_data()
+
+    def columnar():
+        return json_columnar(df, num_filas=len(df))
+
+    print(f"Filas: {args.filas}")
+    for nombre, funcion in (("to_dict + jsonify", clasico), ("columnar", columnar)):
+        segundos, tamano = medir(funcion, args.repeticiones)
+        print(f"  {nombre:<18} {segundos * 1000:9.1f} ms  {tamano / 1024 / 1024:8.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+carga_concurrente.py
+
+Prueba de carga del modo de producción (serve.py + gunicorn): mide las
+peticiones por segundo de /api/filter con 1, 2, ... N workers, para
+comprobar que escalan con el número de núcleos.
+
+Cada petición ordena y busca sobre el archivo completo (la caché de
+resultados se desactiva), así que el trabajo es de CPU (pandas).
+
+Uso (desde la carpeta Mi_Nuevo_Buscador_Web, requiere gunicorn):
+    python benchmarks/carga_concurrente.py --filas 100000 --workers 1,2,4 --duracion 15
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+
+from bench_serializacion import generar_df
+
+CARPETA_APP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def pedir(url, datos=None, cuerpo=None, tipo='application/json'):
+    """Hace una petición HTTP y devuelve el JSON de la respuesta."""
+    if datos is not None:
+        cuerpo = json.dumps(datos).encode()
+    peticion = urllib.request.Request(url, data=cuerpo, headers={'Content-Type': tipo} if cuerpo else {})
+    with urllib.request.urlopen(peticion, timeout=300) as respuesta:
+        return json.loads(respuesta.read())
+
+
+def subir_archivo(base, ruta):
+    """POST multipart de un archivo a /api/upload (solo con la biblioteca estándar)."""
+    limite = uuid.uuid4().hex
+    with open(ruta, 'rb') as archivo:
+        contenido = archivo.read()
+    cuerpo = (
+        f'--{limite}\r\nContent-Disposition: form-data; name="file"; filename="facturas.xlsx"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode() + contenido + f'\r\n--{limite}--\r\n'.encode()
+    return pedir(f'{base}/api/upload', cuerpo=cuerpo, tipo=f'multipart/form-data; boundary={limite}')
+
+
+def arrancar_servidor(workers, puerto, carpeta_uploads):
+    """Lanza serve.py con gunicorn y espera a que responda."""
+    entorno = dict(
+        os.environ,
+        BUSCADOR_UPLOAD_FOLDER=carpeta_uploads,
+        BUSCADOR_CACHE_RESULTADOS_MB='0',  # Cada petición se calcula de verdad
+    )
+    proceso = subprocess.Popen(
+        [sys.executable, os.path.join(CARPETA_APP, 'serve.py'), '--servidor', 'gunicorn',
+         '--workers', str(workers), '--threads', '1', '--bind', f'127.0.0.1:{puerto}'],
+        env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{puerto}/api/cache_stats', timeout=1).read()
+            return proceso
+        except OSError:
+            time.sleep(0.2)
+    proceso.terminate()
+    raise RuntimeError("El servidor no arrancó")
+
+
+def medir_carga(base, file_id, clientes, duracion):
+    """Lanza `clientes` hilos que piden /api/filter sin parar durante `duracion` segundos."""
+    latencias = []
+    errores = [0]
+    lock = threading.Lock()
+    fin = time.monotonic() + duracion
+
+    def cliente(semilla):
+        rng = random.Random(semilla)
+        while time.monotonic() < fin:
+            datos = {
+                'file_id': file_id,
+                'filtros_activos': [],
+                'sort_column': rng.choice(['Vendor Name', 'Invoice Date', 'Total', 'Invoice #']),
+                'sort_direction': rng.choice(['asc', 'desc']),
+                'busqueda': rng.choice(['', f"Proveedor {rng.randint(0, 99)}"]),
+                'limit': 50,
+            }
+            inicio = time.perf_counter()
+            try:
+                pedir(f'{base}/api/filter?formato=columnar', datos)
+            except OSError:
+                with lock:
+                    errores[0] += 1
+                continue
+            with lock:
+                latencias.append(time.perf_counter() - inicio)
+
+    hilos = [threading.Thread(target=cliente, args=(i,)) for i in range(clientes)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    latencias.sort()
+    def percentil(p):
+        return latencias[min(len(latencias) - 1, int(p * len(latencias)))] * 1000 if latencias else 0.0
+    return {
+        'peticiones': len(latencias),
+        'errores': errores[0],
+        'rps': len(latencias) / duracion,
+        'p50_ms': percentil(0.50),
+        'p95_ms': percentil(0.95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filas', type=int, default=100_000)
+    parser.add_argument('--workers', default=None, help="Lista separada por comas (por defecto 1,2,4... hasta los núcleos)")
+    parser.add_argument('--clientes', type=int, default=None, help="Clientes concurrentes (por defecto 2 x workers)")
+    parser.add_argument('--duracion', type=float, default=15.0, help="Segundos de carga por configuración")
+    args = parser.parse_args()
+
+    nucleos = os.cpu_count() or 1
+    if args.workers:
+        lista_workers = [int(w) for w in args.workers.split(',')]
+    else:
+        lista_workers = sorted({min(2 ** i, nucleos) for i in range(nucleos.bit_length() + 1)})
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        ruta_excel = os.path.join(carpeta, 'facturas.xlsx')
+        print(f"Generando {args.filas} filas...")
+        generar_df(args.filas).drop(columns=['_row_status']).to_excel(ruta_excel, index=False, engine='xlsxwriter')
+
+        print(f"Núcleos: {nucleos}")
+        resultados = []
+        for workers in lista_workers:
+            puerto = puerto_libre()
+            base = f'http://127.0.0.1:{puerto}'
+            proceso = arrancar_servidor(workers, puerto, os.path.join(carpeta, f'uploads_{workers}'))
+            try:
+                file_id = subir_archivo(base, ruta_excel)['file_id']
+                while pedir(f'{base}/api/upload_status/{file_id}')['estado'] not in ('listo', 'error'):
+                    time.sleep(0.5)
+                # Calentamiento: que cada worker mapee el sidecar antes de medir
+                medir_carga(base, file_id, workers * 2, 2.0)
+                medida = medir_carga(base, file_id, args.clientes or workers * 2, args.duracion)
+            finally:
+                proceso.terminate()
+                proceso.wait()
+
+            medida['workers'] = workers
+            resultados.append(medida)
+            aceleracion = medida['rps'] / resultados[0]['rps'] if resultados[0]['rps'] else 0.0
+            print(f"  workers={workers:<3} {medida['rps']:8.1f} req/s  x{aceleracion:4.2f}  "
+                  f"p50={medida['p50_ms']:7.1f} ms  p95={medida['p95_ms']:7.1f} ms  errores={medida['errores']}")
+
+
+if __name__ == '__main__':
+    main()
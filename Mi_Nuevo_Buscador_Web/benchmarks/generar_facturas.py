@@ -0,0 +1,145 @@
+"""
+generar_facturas.py
+
+Genera libros de Excel de facturas sintéticas, parecidos a los reales,
+para los benchmarks:
+
+- 'Invoice #' único por fila y 'Vendor Name' con muchos valores distintos
+  (una décima parte de las filas, con distribución de Zipf: pocos
+  proveedores concentran muchas facturas).
+- 'Total' como texto con formato ('$12,345.67', '-$1,234.00' en las notas
+  de crédito), con celdas vacías y "0" que marcan la fila como Incompleta.
+- 'Invoice Date' como fecha real de Excel; columnas de texto con pocos
+  valores (estado, responsable, unidad...) y algunos huecos.
+
+Los libros se guardan en una carpeta de caché y se reutilizan si ya
+existen (el nombre incluye filas, semilla y versión del generador).
+
+Uso (desde la carpeta Mi_Nuevo_Buscador_Web):
+    python benchmarks/generar_facturas.py --filas 100000
+"""
+
+import argparse
+import datetime
+import os
+import tempfile
+
+import numpy as np
+import xlsxwriter
+
+# Si cambia el contenido generado, se sube la versión (invalida la caché)
+VERSION_GENERADOR = 1
+CARPETA_CACHE = os.path.join(tempfile.gettempdir(), 'buscador_bench')
+
+COLUMNAS = [
+    'Invoice #', 'Vendor Name', 'Status', 'Assignee', 'Operating Unit Name',
+    'Pay Status', 'Document Type', 'Total', 'Invoice Date',
+]
+ESTADOS = ['Pending', 'Approved', 'Rejected', 'Paid']
+ESTADOS_PAGO = ['Unpaid', 'Paid', 'Partial']
+TIPOS_DOCUMENTO = ['Invoice', 'Credit Memo', 'Debit Memo']
+UNIDADES = [f'Unidad Operativa {i:02d}' for i in range(30)]
+RESPONSABLES = [f'Analista {i:03d}' for i in range(200)]
+
+# Proporción de celdas de 'Total' vacías y en "0" (ambas dejan la fila Incompleta)
+PROPORCION_TOTAL_VACIO = 0.04
+PROPORCION_TOTAL_CERO = 0.03
+PROPORCION_HUECOS = 0.05  # Celdas vacías en las demás columnas de texto
+
+
+def ruta_libro(filas: int, semilla: int = 0, carpeta: str = CARPETA_CACHE) -> str:
+    return os.path.join(carpeta, f'facturas_{filas}_s{semilla}_v{VERSION_GENERADOR}.xlsx')
+
+
+def generar_libro(filas: int, semilla: int = 0, carpeta: str = CARPETA_CACHE) -> str:
+    """
+    Devuelve la ruta de un libro con `filas` facturas, generándolo si no
+    está en la carpeta de caché.
+
+    Args:
+        filas (int): Número de filas de datos (sin el encabezado).
+        semilla (int): Semilla del generador (mismo valor = mismo libro).
+        carpeta (str): Carpeta de caché de los libros generados.
+
+    Returns:
+        str: Ruta del archivo .xlsx.
+    """
+    ruta = ruta_libro(filas, semilla, carpeta)
+    if os.path.exists(ruta):
+        return ruta
+    os.makedirs(carpeta, exist_ok=True)
+
+    columnas = _columnas_sinteticas(filas, np.random.default_rng(semilla))
+    temporal = f'{ruta}.{os.getpid()}.tmp'
+    # constant_memory: cada fila se escribe a disco enseguida (1M filas no caben cómodas en memoria)
+    libro = xlsxwriter.Workbook(temporal, {'constant_memory': True})
+    hoja = libro.add_worksheet('Facturas')
+    formato_fecha = libro.add_format({'num_format': 'yyyy-mm-dd'})
+    hoja.write_row(0, 0, COLUMNAS)
+    col_fecha = COLUMNAS.index('Invoice Date')
+
+    fechas = columnas.pop('Invoice Date')
+    valores = [columnas[col] for col in COLUMNAS if col != 'Invoice Date']
+    for i in range(filas):
+        fila = i + 1
+        for j, columna in enumerate(valores):
+            valor = columna[i]
+            if valor:
+                hoja.write_string(fila, j if j < col_fecha else j + 1, valor)
+        if fechas[i] is not None:
+            hoja.write_datetime(fila, col_fecha, fechas[i], formato_fecha)
+    libro.close()
+    os.replace(temporal, ruta)
+    return ruta
+
+
+def _columnas_sinteticas(filas: int, rng: np.random.Generator) -> dict:
+    """Los valores de cada columna ('' = celda vacía; None = fecha vacía)."""
+    def con_huecos(valores, proporcion=PROPORCION_HUECOS):
+        valores = np.asarray(valores, dtype=object)
+        valores[rng.random(filas) < proporcion] = ''
+        return valores
+
+    num_proveedores = max(100, filas // 10)
+    proveedores = (rng.zipf(1.1, filas) - 1) % num_proveedores  # La cola larga se reparte entre todos
+    proveedores = rng.permutation(num_proveedores)[proveedores]  # Los frecuentes no son los primeros
+
+    tipos = rng.choice(len(TIPOS_DOCUMENTO), filas, p=[0.85, 0.1, 0.05])
+    montos = np.round(rng.lognormal(7.5, 1.6, filas), 2)
+    totales = np.array([
+        f"-${monto:,.2f}" if tipo == 1 else f"${monto:,.2f}" for monto, tipo in zip(montos, tipos)
+    ], dtype=object)
+    sorteo = rng.random(filas)
+    totales[sorteo < PROPORCION_TOTAL_VACIO] = ''
+    totales[(sorteo >= PROPORCION_TOTAL_VACIO) & (sorteo < PROPORCION_TOTAL_VACIO + PROPORCION_TOTAL_CERO)] = '0'
+
+    inicio = datetime.datetime(2023, 1, 1)
+    dias = rng.integers(0, 730, filas)
+    fechas = [inicio + datetime.timedelta(days=int(d)) for d in dias]
+    for i in np.flatnonzero(rng.random(filas) < 0.02):
+        fechas[i] = None
+
+    return {
+        'Invoice #': [f'INV-{i:08d}' for i in range(filas)],
+        'Vendor Name': [f'Proveedor {v:06d} S.A. de C.V.' for v in proveedores],
+        'Status': con_huecos(np.asarray(ESTADOS, dtype=object)[rng.integers(0, len(ESTADOS), filas)]),
+        'Assignee': con_huecos(np.asarray(RESPONSABLES, dtype=object)[rng.integers(0, len(RESPONSABLES), filas)], 0.1),
+        'Operating Unit Name': con_huecos(np.asarray(UNIDADES, dtype=object)[rng.integers(0, len(UNIDADES), filas)]),
+        'Pay Status': con_huecos(np.asarray(ESTADOS_PAGO, dtype=object)[rng.integers(0, len(ESTADOS_PAGO), filas)]),
+        'Document Type': np.asarray(TIPOS_DOCUMENTO, dtype=object)[tipos],
+        'Total': totales,
+        'Invoice Date': fechas,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filas', type=int, default=100_000)
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--carpeta', default=CARPETA_CACHE)
+    args = parser.parse_args()
+    print(generar_libro(args.filas, args.semilla, args.carpeta))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+# gunicorn.conf.py
+#
+# Configuración de producción (varios procesos).
+# Uso (desde la carpeta Mi_Nuevo_Buscador_Web):
+#     gunicorn -c gunicorn.conf.py app:app
+# o simplemente:
+#     python serve.py
+#
+# Cada worker tiene sus propias cachés, pero los datos NO se parsean en
+# cada uno: el worker que recibe el archivo escribe el sidecar Arrow y
+# los demás lo mapean en memoria, compartiendo las mismas páginas.
+
+import multiprocessing
+import os
+
+bind = os.environ.get('BUSCADOR_BIND', '0.0.0.0:8000')
+
+# Un proceso por núcleo (pandas está limitado por el GIL dentro de cada proceso)
+workers = int(os.environ.get('BUSCADOR_WORKERS', multiprocessing.cpu_count()))
+
+# Algunos hilos por worker para las esperas de E/S (uploads, descargas, ingesta)
+worker_class = 'gthread'
+threads = int(os.environ.get('BUSCADOR_THREADS', '4'))
+
+# Las exportaciones y la espera de una ingesta pueden tardar
+timeout = int(os.environ.get('BUSCADOR_TIMEOUT', '300'))
+
+# Sin preload: cada worker crea sus cachés y su pool de ingesta después del fork
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
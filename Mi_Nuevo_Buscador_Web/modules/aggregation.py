@@ -0,0 +1,165 @@
+"""
+aggregation.py
+
+Motor de agrupación (Group By) compartido por /api/group_by y
+/api/download_excel_grouped.
+
+- Una o varias columnas de agrupación.
+- Una o varias columnas de métrica (por defecto, la columna de monto
+  del archivo: 'Total', 'Monto', 'Amount'...), convertidas a número una
+  sola vez, quitando '$' y ','.
+- Las métricas pedidas (suma, promedio, mínimo, máximo, conteo).
+- Sin ordenar los grupos al agrupar (`sort=False`) y, si se pide, solo
+  los N grupos con mayor suma (`nlargest`) en vez de un orden completo.
+
+Las columnas del resultado se llaman '<columna>_<métrica>', ej. 'Total_sum'.
+
+Para los datasets de varias hojas/archivos, cada parte se agrupa por
+separado con las métricas PARCIALES (suma, conteo, mínimo, máximo) y
+`combinar_parciales` las reduce: el promedio sale de suma / conteo.
+"""
+
+import numpy as np
+import pandas as pd
+
+from modules.montos import encontrar_columna_monto, convertir_montos
+
+METRICAS_VALIDAS = ('sum', 'mean', 'min', 'max', 'count')
+
+# Métricas que se pueden combinar entre partes, y cómo se combinan
+PARCIALES = ('sum', 'count', 'min', 'max')
+REDUCCION_PARCIALES = {'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max'}
+
+# Nombre de la métrica cuando el archivo no tiene columna de monto (se agrupa con ceros)
+COLUMNA_MONTO_POR_DEFECTO = 'Total'
+
+def agrupar(df: pd.DataFrame, columnas_grupo, columnas_metrica: list = None,
+            metricas: list = METRICAS_VALIDAS, top_n: int = None,
+            posiciones: np.ndarray = None, valores_numericos: dict = None) -> pd.DataFrame:
+    """
+    Agrupa el DataFrame y calcula las métricas de cada grupo.
+
+    Args:
+        df (pd.DataFrame): El DataFrame original.
+        columnas_grupo (str | list): Columna(s) por las que se agrupa.
+        columnas_metrica (list, opcional): Columnas numéricas a resumir.
+            Por defecto, la columna de monto del archivo.
+        metricas (list): Métricas a calcular (de METRICAS_VALIDAS).
+        top_n (int, opcional): Si se indica, solo los N grupos con mayor suma
+            de la primera métrica.
+        posiciones (np.ndarray, opcional): Posiciones de las filas a usar
+            (ej. las filas que cumplen los filtros). Por defecto, todas.
+        valores_numericos (dict, opcional): {columna: np.ndarray} con columnas de
+            métrica ya convertidas a número (todas las filas de `df`), para no
+            volver a limpiar el texto en cada petición.
+
+    Returns:
+        pd.DataFrame: Una fila por grupo, ordenada por la suma (de mayor a menor).
+
+    Raises:
+        KeyError: Si alguna columna de agrupación o de métrica no existe.
+        ValueError: Si se pide una métrica no válida.
+    """
+    if isinstance(columnas_grupo, str):
+        columnas_grupo = [columnas_grupo]
+    metricas = list(metricas) or list(METRICAS_VALIDAS)
+    invalidas = [m for m in metricas if m not in METRICAS_VALIDAS]
+    if invalidas:
+        raise ValueError(f"Métricas no válidas: {invalidas}")
+
+    faltantes = [col for col in columnas_grupo if col not in df.columns]
+    if faltantes:
+        raise KeyError(faltantes[0])
+
+    if not columnas_metrica:
+        columna_monto = encontrar_columna_monto(df)
+        columnas_metrica = [columna_monto] if columna_monto else []
+    faltantes = [col for col in columnas_metrica if col not in df.columns]
+    if faltantes:
+        raise KeyError(faltantes[0])
+
+    # 1. Solo las columnas necesarias, y solo las filas pedidas
+    if posiciones is not None:
+        claves = [df[col].take(posiciones) for col in columnas_grupo]
+        fuentes_metrica = {col: df[col].take(posiciones) for col in columnas_metrica}
+    else:
+        claves = [df[col] for col in columnas_grupo]
+        fuentes_metrica = {col: df[col] for col in columnas_metrica}
+    indice_filas = claves[0].index
+
+    # 2. Métricas a número, una sola vez (los valores no numéricos cuentan como 0)
+    valores_numericos = valores_numericos or {}
+    if fuentes_metrica:
+        valores = pd.DataFrame({
+            col: _metrica_numerica(serie, valores_numericos.get(col), posiciones)
+            for col, serie in fuentes_metrica.items()
+        })
+    else:
+        valores = pd.DataFrame({COLUMNA_MONTO_POR_DEFECTO: np.zeros(len(indice_filas))}, index=indice_filas)
+
+    if valores.empty:
+        columnas = columnas_grupo + [f"{col}_{m}" for col in valores.columns for m in metricas]
+        return pd.DataFrame(columns=columnas)
+
+    # 3. GroupBy: observed=True (columnas categóricas) y sin ordenar los grupos
+    df_agrupado = valores.groupby(claves, observed=True, sort=False).agg(metricas)
+
+    # Pandas crea un MultiIndex, ej: ('Total', 'sum') -> 'Total_sum'
+    df_agrupado.columns = [f"{col}_{metrica}" for col, metrica in df_agrupado.columns]
+    df_agrupado = df_agrupado.reset_index()
+
+    # 4. Orden por la suma de la primera métrica: top-N o todos
+    return _ordenar_grupos(df_agrupado, list(valores.columns), metricas, top_n)
+
+def combinar_parciales(parciales: list, columnas_grupo, metricas: list = METRICAS_VALIDAS,
+                       top_n: int = None) -> pd.DataFrame:
+    """
+    Combina los resultados de `agrupar(..., metricas=PARCIALES)` de varias
+    partes de un dataset en un solo resultado, como si se hubiera agrupado
+    todo junto.
+
+    Args:
+        parciales (list): DataFrames parciales (mismas columnas de grupo y de métrica).
+        columnas_grupo (str | list): Columna(s) por las que se agrupó.
+        metricas (list): Métricas del resultado final (de METRICAS_VALIDAS).
+        top_n (int, opcional): Si se indica, solo los N grupos con mayor suma.
+
+    Returns:
+        pd.DataFrame: Igual que `agrupar`.
+    """
+    if isinstance(columnas_grupo, str):
+        columnas_grupo = [columnas_grupo]
+    metricas = list(metricas) or list(METRICAS_VALIDAS)
+    invalidas = [m for m in metricas if m not in METRICAS_VALIDAS]
+    if invalidas:
+        raise ValueError(f"Métricas no válidas: {invalidas}")
+
+    juntos = pd.concat(parciales, ignore_index=True)
+    bases = list(dict.fromkeys(col.rpartition('_')[0] for col in juntos.columns if col not in columnas_grupo))
+    if juntos.empty:
+        return pd.DataFrame(columns=columnas_grupo + [f"{base}_{m}" for base in bases for m in metricas])
+
+    # Reducción: suma de sumas y de conteos, mínimo de mínimos, máximo de máximos
+    reduccion = {f"{base}_{m}": REDUCCION_PARCIALES[m] for base in bases for m in PARCIALES}
+    df_agrupado = juntos.groupby(columnas_grupo, observed=True, sort=False).agg(reduccion)
+    for base in bases:
+        df_agrupado[f"{base}_mean"] = df_agrupado[f"{base}_sum"] / df_agrupado[f"{base}_count"]
+    df_agrupado = df_agrupado[[f"{base}_{m}" for base in bases for m in metricas]].reset_index()
+
+    return _ordenar_grupos(df_agrupado, bases, metricas, top_n)
+
+def _ordenar_grupos(df_agrupado: pd.DataFrame, bases: list, metricas: list, top_n) -> pd.DataFrame:
+    """Ordena por la suma (o la primera métrica) de la primera columna de métrica: top-N o todos."""
+    columna_orden = f"{bases[0]}_{'sum' if 'sum' in metricas else metricas[0]}"
+    if top_n:
+        return df_agrupado.nlargest(int(top_n), columna_orden).reset_index(drop=True)
+    return df_agrupado.sort_values(by=columna_orden, ascending=False, kind='stable').reset_index(drop=True)
+
+def _metrica_numerica(serie: pd.Series, ya_convertida, posiciones) -> pd.Series:
+    """La columna de métrica como número (NaN -> 0), reutilizando la conversión previa si existe."""
+    if ya_convertida is not None:
+        valores = ya_convertida if posiciones is None else ya_convertida[posiciones]
+        return pd.Series(np.nan_to_num(valores, nan=0.0), index=serie.index)
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.fillna(0)
+    return convertir_montos(serie).fillna(0)
@@ -0,0 +1,281 @@
+"""
+cache.py
+
+Caché en memoria (por proceso) de los DataFrames ya procesados
+por `cargar_datos`, para no volver a leer el Excel en cada petición.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class _Entrada:
+    """Un DataFrame guardado en la caché junto con sus metadatos."""
+
+    def __init__(self, df, firma, tamano):
+        self.df = df
+        self.firma = firma          # (mtime, tamaño) del archivo en disco
+        self.tamano = tamano        # Bytes que ocupa el DataFrame en memoria
+        self.creado = time.monotonic()
+        self.derivados = {}         # Estructuras calculadas a partir del DataFrame (índices, etc.)
+        self.tamanos_derivados = {} # Bytes de cada derivado ya sumados a `tamano`
+
+
+class CacheDatos:
+    """
+    Caché LRU de DataFrames, con límite de memoria y expiración (TTL).
+
+    - La clave es el `file_id` de la carga.
+    - Si el archivo en disco cambia (fecha o tamaño), la entrada se descarta.
+    - Si se supera `max_bytes`, se expulsan las entradas usadas hace más tiempo.
+      El tamaño de una entrada incluye sus derivados (índice de búsqueda, montos...).
+    - Las entradas con más de `ttl_segundos` se vuelven a cargar.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024, ttl_segundos=30 * 60):
+        self.max_bytes = max_bytes
+        self.ttl_segundos = ttl_segundos
+        self._entradas = OrderedDict()
+        self._bytes_usados = 0
+        self._lock = threading.Lock()
+        # Un lock por clave para no parsear dos veces el mismo archivo (reentrante:
+        # un derivado se puede construir a partir de otro, ej. el monto total de los montos).
+        # clave -> [lock, hilos que lo usan]; se descarta cuando la clave sale de la caché
+        self._locks_carga = {}
+
+        # Contadores
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self.expiraciones = 0
+        self.invalidaciones = 0
+
+    def obtener(self, clave, ruta_archivo, cargador):
+        """
+        Devuelve el DataFrame de `clave`, cargándolo con `cargador(ruta_archivo)`
+        solo si no está en la caché (o si ya no es válido).
+
+        Args:
+            clave (str): Identificador del archivo (el `file_id`).
+            ruta_archivo (str): Ruta del archivo en disco.
+            cargador (callable): Función que recibe la ruta y devuelve un DataFrame.
+
+        Returns:
+            pd.DataFrame: El DataFrame cargado. No debe modificarse, es compartido.
+        """
+        firma = self._firma(ruta_archivo)
+        df = self._buscar(clave, firma)
+        if df is not None:
+            return df
+
+        with self._lock_carga(clave):
+            # Otro hilo pudo haberlo cargado mientras esperábamos
+            df = self._buscar(clave, firma, contar=False)
+            if df is not None:
+                return df
+
+            df = cargador(ruta_archivo)
+            if not df.empty:  # No guardamos cargas fallidas
+                self._guardar(clave, _Entrada(df, firma, self._tamano_df(df)))
+            return df
+
+    def derivado(self, clave, df, nombre, constructor):
+        """
+        Devuelve una estructura derivada del DataFrame (ej. un índice de búsqueda),
+        construyéndola con `constructor(df)` una sola vez por entrada.
+
+        Si `df` ya no es el DataFrame guardado en la caché (fue expulsado o
+        recargado), se construye igual pero no se guarda.
+
+        El derivado cuenta para `max_bytes`. Los que crecen con el uso (el
+        índice, que indexa cada columna la primera vez que se filtra) se
+        vuelven a medir cada vez que se piden.
+        """
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada.df is not df:
+                entrada = None
+            elif nombre in entrada.derivados:
+                valor = entrada.derivados[nombre]
+                if not hasattr(valor, 'tamano_bytes'):
+                    return valor
+
+        if entrada is None:
+            return constructor(df)
+
+        if nombre not in entrada.derivados:
+            with self._lock_carga(clave):
+                if nombre not in entrada.derivados:
+                    entrada.derivados[nombre] = constructor(df)
+        valor = entrada.derivados[nombre]
+        self._cobrar_derivados(clave, entrada, {nombre: valor})
+        return valor
+
+    def derivados(self, clave, df):
+        """Copia de las estructuras derivadas ya construidas para `df` ({} si `df` ya no está en la caché)."""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada.df is not df:
+                return {}
+            return dict(entrada.derivados)
+
+    def agregar_derivados(self, clave, df, derivados):
+        """
+        Guarda estructuras derivadas ya construidas (ej. extendidas a partir de
+        las de otra entrada). Las que ya existan no se reemplazan.
+        """
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada.df is not df:
+                return
+            agregados = {
+                nombre: valor for nombre, valor in derivados.items() if nombre not in entrada.derivados
+            }
+            entrada.derivados.update(agregados)
+        self._cobrar_derivados(clave, entrada, agregados)
+
+    def invalidar(self, clave):
+        """Descarta la entrada de `clave`, si existe."""
+        with self._lock:
+            if clave in self._entradas:
+                self._quitar(clave)
+                self.invalidaciones += 1
+
+    def invalidar_prefijo(self, prefijo):
+        """Descarta todas las entradas cuya clave empieza por `prefijo` (ej. todas las hojas de un archivo)."""
+        with self._lock:
+            for clave in [c for c in self._entradas if str(c).startswith(prefijo)]:
+                self._quitar(clave)
+                self.invalidaciones += 1
+
+    def limpiar(self):
+        """Vacía toda la caché (los contadores se conservan)."""
+        with self._lock:
+            for clave in list(self._entradas):
+                self._quitar(clave)
+
+    def estadisticas(self):
+        """Devuelve un diccionario con el estado y los contadores de la caché."""
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._entradas),
+                "bytes_usados": self._bytes_usados,
+                "max_bytes": self.max_bytes,
+                "ttl_segundos": self.ttl_segundos,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(self.aciertos / total, 4) if total else 0.0,
+                "expulsiones": self.expulsiones,
+                "expiraciones": self.expiraciones,
+                "invalidaciones": self.invalidaciones,
+            }
+
+    # --- Funciones internas ---
+
+    def _buscar(self, clave, firma, contar=True):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                if entrada.firma != firma:
+                    # El archivo cambió en disco
+                    self._quitar(clave)
+                    self.invalidaciones += 1
+                    entrada = None
+                elif time.monotonic() - entrada.creado > self.ttl_segundos:
+                    self._quitar(clave)
+                    self.expiraciones += 1
+                    entrada = None
+
+            if entrada is None:
+                if contar:
+                    self.fallos += 1
+                return None
+
+            self._entradas.move_to_end(clave)  # Marcar como usada recientemente
+            if contar:
+                self.aciertos += 1
+            return entrada.df
+
+    def _guardar(self, clave, entrada):
+        with self._lock:
+            if clave in self._entradas:
+                self._quitar(clave)
+            self._entradas[clave] = entrada
+            self._bytes_usados += entrada.tamano
+            self._expulsar_sobrantes()
+
+    def _expulsar_sobrantes(self):
+        # Expulsa las menos usadas hasta respetar el límite
+        # (la entrada recién guardada o usada, la última, siempre se conserva)
+        while self._bytes_usados > self.max_bytes and len(self._entradas) > 1:
+            clave_vieja = next(iter(self._entradas))
+            self._quitar(clave_vieja)
+            self.expulsiones += 1
+
+    def _cobrar_derivados(self, clave, entrada, derivados):
+        """Suma (o ajusta) los bytes de `derivados` al tamaño de la entrada y expulsa si hace falta."""
+        # Se miden fuera del lock general: medir un índice grande no es instantáneo
+        tamanos = {nombre: self._tamano_derivado(valor) for nombre, valor in derivados.items()}
+        with self._lock:
+            diferencia = 0
+            for nombre, tamano in tamanos.items():
+                diferencia += tamano - entrada.tamanos_derivados.get(nombre, 0)
+                entrada.tamanos_derivados[nombre] = tamano
+            entrada.tamano += diferencia
+            if self._entradas.get(clave) is not entrada:
+                return  # Ya no está en la caché: no cuenta
+            self._bytes_usados += diferencia
+            if diferencia > 0:
+                self._entradas.move_to_end(clave)
+                self._expulsar_sobrantes()
+
+    def _quitar(self, clave):
+        entrada = self._entradas.pop(clave)
+        self._bytes_usados -= entrada.tamano
+        self._soltar_lock_carga(clave)
+
+    @contextmanager
+    def _lock_carga(self, clave):
+        """Toma el lock de carga de `clave` (se crea si no existe)."""
+        with self._lock:
+            registro = self._locks_carga.setdefault(clave, [threading.RLock(), 0])
+            registro[1] += 1
+        try:
+            with registro[0]:
+                yield
+        finally:
+            with self._lock:
+                registro[1] -= 1
+                if clave not in self._entradas:
+                    # La carga falló o la entrada ya se expulsó
+                    self._soltar_lock_carga(clave)
+
+    def _soltar_lock_carga(self, clave):
+        """Descarta el lock de `clave` si ningún hilo lo está usando (con `self._lock` tomado)."""
+        registro = self._locks_carga.get(clave)
+        if registro is not None and registro[1] == 0:
+            del self._locks_carga[clave]
+
+    @staticmethod
+    def _firma(ruta_archivo):
+        info = os.stat(ruta_archivo)
+        return (info.st_mtime_ns, info.st_size)
+
+    @staticmethod
+    def _tamano_df(df):
+        return int(df.memory_usage(deep=True, index=True).sum())
+
+    @classmethod
+    def _tamano_derivado(cls, valor):
+        if hasattr(valor, 'tamano_bytes'):
+            return int(valor.tamano_bytes())
+        if hasattr(valor, 'nbytes'):
+            return int(valor.nbytes)
+        if hasattr(valor, 'memory_usage'):
+            return cls._tamano_df(valor)
+        return sys.getsizeof(valor)
@@ -0,0 +1,104 @@
+"""
+dataset.py
+
+Datasets de varias partes: las hojas de un libro (ej. una hoja por mes)
+o varios archivos combinados.
+
+- El esquema es la unión de las columnas de todas las partes, más la
+  columna virtual '_hoja' con el nombre de la parte de cada fila.
+  Si una parte no tiene una columna, sus filas la tienen vacía.
+- Antes de cargar una parte se revisa si la consulta puede tocarla
+  (`parte_puede_coincidir`): un filtro sobre una columna que la parte no
+  tiene, o sobre '_hoja', la descarta sin leerla.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .filters import coincide_texto
+
+# Columna virtual con el nombre de la hoja / archivo de cada fila
+COLUMNA_HOJA = '_hoja'
+
+
+def clave_parte(parte: dict) -> str:
+    """Clave de caché de una parte: el dataset (primera hoja) o '<dataset>.h<hoja>'."""
+    hoja = parte.get('hoja', 0)
+    return parte['dataset'] if hoja == 0 else f"{parte['dataset']}.h{hoja}"
+
+
+def esquema_unificado(partes: list) -> list:
+    """
+    Unión de las columnas de todas las partes, en orden de aparición,
+    con '_row_status' y '_hoja' al final.
+    """
+    columnas = []
+    for parte in partes:
+        for col in parte.get('columnas') or []:
+            if col not in columnas and col != '_row_status':
+                columnas.append(col)
+    return columnas + ['_row_status', COLUMNA_HOJA]
+
+
+def parte_puede_coincidir(parte: dict, filtros_normalizados: tuple) -> bool:
+    """
+    False si la parte seguro no tiene filas que cumplan los filtros
+    (ver `filters.normalizar_filtros`), así que no hace falta cargarla.
+    """
+    columnas = parte.get('columnas')
+    for columna, op, valores in filtros_normalizados:
+        if columna == COLUMNA_HOJA:
+            if not coincide_texto(op, valores, str(parte.get('nombre', ''))):
+                return False
+        elif columnas is not None and columna not in columnas:
+            # Columna vacía en esta parte: ningún filtro (con valor) se cumple con ""
+            return False
+    return True
+
+
+def filtros_de_parte(filtros: list) -> list:
+    """Los filtros que se aplican dentro de cada parte ('_hoja' ya se resolvió al elegir las partes)."""
+    return [f for f in (filtros or []) if f.get('columna') != COLUMNA_HOJA]
+
+
+def alinear(df: pd.DataFrame, columnas: list, nombre_parte: str) -> pd.DataFrame:
+    """
+    Las filas de una parte con las `columnas` del esquema unificado
+    (vacías si la parte no las tiene) y '_hoja' con el nombre de la parte.
+    """
+    datos = {}
+    for col in columnas:
+        if col == COLUMNA_HOJA:
+            datos[col] = nombre_parte
+        elif col in df.columns:
+            datos[col] = df[col]
+        else:
+            datos[col] = ""
+    return pd.DataFrame(datos, index=df.index, columns=columnas)
+
+
+def filas_en_orden(dfs: list, nombres: list, ids_parte: np.ndarray, posiciones: np.ndarray,
+                   columnas: list) -> pd.DataFrame:
+    """
+    Materializa filas de varias partes en el orden dado.
+
+    Args:
+        dfs (list): El DataFrame de cada parte (None si no se necesita).
+        nombres (list): El nombre de cada parte.
+        ids_parte (np.ndarray): Para cada fila, el índice de su parte.
+        posiciones (np.ndarray): Para cada fila, su posición dentro de la parte.
+        columnas (list): Columnas del esquema unificado.
+
+    Returns:
+        pd.DataFrame: Las filas (índice 0..n-1), con las columnas del esquema.
+    """
+    trozos, orden = [], []
+    for id_parte in np.unique(ids_parte):
+        filas = np.flatnonzero(ids_parte == id_parte)
+        df_parte = dfs[id_parte].take(posiciones[filas])
+        trozos.append(alinear(df_parte, columnas, nombres[id_parte]))
+        orden.append(filas)
+    if not trozos:
+        return pd.DataFrame(columns=columnas)
+    juntas = pd.concat(trozos, ignore_index=True)
+    return juntas.take(np.argsort(np.concatenate(orden), kind='stable')).reset_index(drop=True)
@@ -0,0 +1,125 @@
+"""
+exporter.py
+
+Exportación de resultados a Excel, CSV o CSV comprimido (gzip),
+escribiendo por bloques de filas para no tener el archivo completo en RAM.
+
+- xlsx: xlsxwriter en modo `constant_memory`, sobre un archivo temporal
+  "spooled" (en memoria si es chico, en disco si crece).
+- csv / csv.gz: se genera y se envía bloque por bloque.
+
+Las funciones devuelven un generador de bytes que la ruta de Flask
+envía como respuesta en streaming.
+"""
+
+import tempfile
+import zlib
+
+import pandas as pd
+import xlsxwriter
+
+FILAS_POR_BLOQUE = 5000
+TAMANO_TROZO = 64 * 1024             # Bytes por trozo enviado al navegador
+MAX_SPOOL_EN_MEMORIA = 8 * 1024 * 1024  # Más grande que esto, el temporal pasa a disco
+
+# formato -> (extensión, mimetype)
+FORMATOS = {
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('csv', 'text/csv; charset=utf-8'),
+    'csv.gz': ('csv.gz', 'application/gzip'),
+}
+
+def exportar(df: pd.DataFrame, formato: str = 'xlsx', nombre_hoja: str = 'Resultados'):
+    """
+    Prepara la exportación de un DataFrame.
+
+    Args:
+        df (pd.DataFrame): Las filas a exportar (el índice no se incluye).
+        formato (str): 'xlsx', 'csv' o 'csv.gz'.
+        nombre_hoja (str): Nombre de la hoja (solo para xlsx).
+
+    Returns:
+        tuple: (generador de bytes, extensión, mimetype).
+
+    Raises:
+        ValueError: Si el formato no es válido.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de exportación no válido: '{formato}'")
+    extension, mimetype = FORMATOS[formato]
+
+    if formato == 'xlsx':
+        generador = _generar_xlsx(df, nombre_hoja)
+    elif formato == 'csv':
+        generador = _generar_csv(df)
+    else:
+        generador = _comprimir_gzip(_generar_csv(df))
+    return generador, extension, mimetype
+
+def _bloques(df: pd.DataFrame):
+    """Recorre el DataFrame en bloques de FILAS_POR_BLOQUE filas."""
+    for inicio in range(0, len(df), FILAS_POR_BLOQUE):
+        yield df.iloc[inicio:inicio + FILAS_POR_BLOQUE]
+
+def _generar_csv(df: pd.DataFrame):
+    # BOM de UTF-8 para que Excel reconozca los acentos al abrir el CSV
+    yield '\ufeff'.encode('utf-8')
+    yield df.iloc[:0].to_csv(index=False).encode('utf-8')  # Encabezados
+    for bloque in _bloques(df):
+        yield bloque.to_csv(index=False, header=False).encode('utf-8')
+
+def _comprimir_gzip(trozos):
+    compresor = zlib.compressobj(wbits=31)  # 31 = formato gzip
+    for trozo in trozos:
+        comprimido = compresor.compress(trozo)
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
+
+def _generar_xlsx(df: pd.DataFrame, nombre_hoja: str):
+    # El .xlsx es un zip: se escribe completo en el temporal ANTES de empezar a
+    # enviar (así los errores todavía se pueden responder con un 500)
+    archivo = tempfile.SpooledTemporaryFile(max_size=MAX_SPOOL_EN_MEMORIA)
+    try:
+        _escribir_xlsx(df, nombre_hoja, archivo)
+        archivo.seek(0)
+    except Exception:
+        archivo.close()
+        raise
+    return _leer_por_trozos(archivo)
+
+def _leer_por_trozos(archivo):
+    """Envía el archivo temporal en trozos y lo cierra (borra) al terminar."""
+    try:
+        while True:
+            trozo = archivo.read(TAMANO_TROZO)
+            if not trozo:
+                break
+            yield trozo
+    finally:
+        archivo.close()
+
+def _escribir_xlsx(df: pd.DataFrame, nombre_hoja: str, archivo) -> None:
+    """Escribe el DataFrame como .xlsx en `archivo`, fila por fila y en orden."""
+    # constant_memory: cada fila se vuelca a disco al pasar a la siguiente
+    libro = xlsxwriter.Workbook(archivo, {'constant_memory': True})
+    try:
+        hoja = libro.add_worksheet(nombre_hoja[:31])  # Excel limita el nombre a 31 caracteres
+        formato_encabezado = libro.add_format({'bold': True, 'border': 1})
+        hoja.write_row(0, 0, [str(col) for col in df.columns], formato_encabezado)
+
+        fila_excel = 1
+        for bloque in _bloques(df):
+            columnas = [_valores_columna(bloque.iloc[:, i]) for i in range(bloque.shape[1])]
+            for valores in zip(*columnas):
+                hoja.write_row(fila_excel, 0, valores)
+                fila_excel += 1
+    finally:
+        libro.close()
+
+def _valores_columna(serie: pd.Series) -> list:
+    """Valores de la columna como lista de Python; los vacíos (NaN) se escriben como celdas vacías."""
+    valores = serie.tolist()
+    if serie.hasnans:
+        valores = [None if pd.isna(valor) else valor for valor in valores]
+    return valores
@@ -0,0 +1,135 @@
+"""
+facets.py
+
+Conteos por faceta para /api/facets: para cada columna pedida, cuántas
+de las filas filtradas tienen cada valor y cuánto suman sus montos.
+
+- Los filtros se aplican una sola vez (posiciones) y todas las columnas
+  se cuentan sobre esas mismas filas.
+- Cada columna se cuenta con `np.bincount` sobre los códigos del índice de
+  búsqueda (IndiceColumna): los valores ya están factorizados, no se agrupa
+  texto. La suma de montos es el mismo bincount, con los montos como pesos.
+- Solo se convierten a texto los valores que entran en el top-N.
+
+Para los datasets de varias hojas/archivos, cada parte se cuenta por
+separado (`tabla_faceta`) y `combinar_facetas` suma los conteos por valor.
+"""
+
+import numpy as np
+import pandas as pd
+
+ORDENES_VALIDOS = ('conteo', 'monto')
+
+
+def contar_faceta(codigos: np.ndarray, num_valores: int, posiciones: np.ndarray = None,
+                  montos: np.ndarray = None):
+    """
+    Conteo de filas y suma de montos de cada valor distinto de una columna.
+
+    Args:
+        codigos (np.ndarray): Código (id del valor) de cada fila, de `IndiceColumna`.
+        num_valores (int): Número de valores distintos de la columna.
+        posiciones (np.ndarray, opcional): Filas a contar. Por defecto, todas.
+        montos (np.ndarray, opcional): La columna de monto como float64 (todas
+            las filas). Los valores no numéricos suman 0, igual que al agrupar.
+
+    Returns:
+        tuple: (conteos, sumas) por id de valor. `sumas` es None si no hay montos.
+    """
+    if posiciones is not None:
+        codigos = codigos[posiciones]
+    conteos = np.bincount(codigos, minlength=num_valores)
+    sumas = None
+    if montos is not None:
+        pesos = montos if posiciones is None else montos[posiciones]
+        sumas = np.bincount(codigos, weights=np.nan_to_num(pesos, nan=0.0), minlength=num_valores)
+    return conteos, sumas
+
+
+def tabla_faceta(etiquetas, conteos: np.ndarray, sumas: np.ndarray = None) -> pd.DataFrame:
+    """
+    Los valores con al menos una fila, como tabla (índice = valor, columnas
+    'conteo' y, si hay montos, 'monto'), para combinarla con la de otras partes.
+    """
+    presentes = np.flatnonzero(conteos)
+    datos = {'conteo': conteos[presentes]}
+    if sumas is not None:
+        datos['monto'] = sumas[presentes]
+    indice = pd.Index([etiqueta_valor(etiquetas[i]) for i in presentes], dtype=object)
+    return pd.DataFrame(datos, index=indice)
+
+
+def combinar_facetas(tablas: list) -> pd.DataFrame:
+    """
+    Suma las tablas de `tabla_faceta` de varias partes por valor. Los valores
+    conservan el orden en que aparecen por primera vez (parte por parte).
+    """
+    tablas = [tabla for tabla in tablas if not tabla.empty]
+    if not tablas:
+        return pd.DataFrame({'conteo': np.empty(0, dtype=np.int64)}, index=pd.Index([], dtype=object))
+    juntas = pd.concat(tablas)
+    # Las partes sin columna de monto no suman nada (NaN -> 0 al sumar)
+    return juntas.groupby(level=0, sort=False).sum()
+
+
+def resumen_faceta(etiquetas, conteos: np.ndarray, sumas: np.ndarray = None,
+                   limite: int = 10, orden: str = 'conteo') -> dict:
+    """
+    Los `limite` valores con más filas (o más monto, con orden='monto') de
+    una faceta. A igual conteo se conserva el orden de los valores.
+
+    Args:
+        etiquetas (list | pd.Index): El valor de cada id.
+        conteos (np.ndarray): Filas de cada valor (0 = no aparece en las filas filtradas).
+        sumas (np.ndarray, opcional): Suma de montos de cada valor.
+        limite (int): Máximo de valores devueltos.
+        orden (str): 'conteo' o 'monto' (de ORDENES_VALIDOS).
+
+    Returns:
+        dict: {"valores": [{"valor", "conteo", "monto"}], "distintos": valores
+              con al menos una fila, "otros": {"conteo", "monto"} de los que no
+              entraron en el top}. Sin montos, "monto" es None.
+    """
+    if orden not in ORDENES_VALIDOS:
+        raise ValueError(f"Orden no válido: {orden}")
+    clave = sumas if orden == 'monto' and sumas is not None else conteos
+    presentes = np.flatnonzero(conteos)
+    seleccion = presentes[_mayores(clave[presentes], limite)]
+
+    valores = [
+        {
+            "valor": etiqueta_valor(etiquetas[i]),
+            "conteo": int(conteos[i]),
+            "monto": float(sumas[i]) if sumas is not None else None
+        }
+        for i in seleccion
+    ]
+    otros_conteo = int(conteos.sum()) - sum(v["conteo"] for v in valores)
+    otros_monto = None
+    if sumas is not None:
+        otros_monto = float(sumas.sum() - sumas[seleccion].sum())
+    return {
+        "valores": valores,
+        "distintos": len(presentes),
+        "otros": {"conteo": otros_conteo, "monto": otros_monto}
+    }
+
+
+def etiqueta_valor(valor) -> str:
+    """El valor como texto para la respuesta (los nulos, como celda vacía)."""
+    return "" if pd.isna(valor) else str(valor)
+
+
+def _mayores(claves: np.ndarray, limite: int) -> np.ndarray:
+    """
+    Posiciones de los `limite` mayores de `claves`, de mayor a menor (orden
+    estable). Solo se ordenan los que entran, no la columna completa.
+    """
+    if len(claves) > limite:
+        umbral = np.partition(claves, len(claves) - limite)[len(claves) - limite]
+        mayores = np.flatnonzero(claves > umbral)
+        iguales = np.flatnonzero(claves == umbral)[:limite - len(mayores)]
+        seleccion = np.sort(np.concatenate([mayores, iguales]))
+    else:
+        seleccion = np.arange(len(claves))
+    return seleccion[np.argsort(-claves[seleccion], kind='stable')]
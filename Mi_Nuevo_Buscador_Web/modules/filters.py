@@ -1,67 +1,278 @@
-# modules/filters.py (Versión 2 - Con Lógica OR para la misma columna)
+# modules/filters.py (Versión 4 - Operadores tipados sobre los valores distintos)
 
+import numpy as np
 import pandas as pd
 from collections import defaultdict # Para agrupar filtros por columna
 
-def aplicar_filtros_dinamicos(df: pd.DataFrame, filtros: list) -> pd.DataFrame:
+from .montos import convertir_montos
+from .search_index import IndiceColumna, a_fechas
+
+# Caracteres que hacen que un valor se interprete como expresión regular
+CARACTERES_REGEX = set('.^$*+?{}[]\\|()')
+
+# --- Operadores de los filtros (campo 'op'; por defecto 'contains') ---
+OPERADORES_TEXTO = ('contains', 'eq', 'in', 'prefix')
+OPERADORES_NUMERO = ('gt', 'gte', 'lt', 'lte', 'between')
+OPERADORES_FECHA = ('date_from', 'date_to', 'date_between')
+OPERADORES = OPERADORES_TEXTO + OPERADORES_NUMERO + OPERADORES_FECHA
+
+# Tipos que puede tener un valor de filtro (o cada elemento de una lista de valores)
+TIPOS_VALOR = (str, int, float, bool)
+
+def normalizar_filtros(filtros: list) -> tuple:
+    """
+    Forma canónica de un conjunto de filtros, para usarla como clave de caché
+    y para `filtrar_posiciones`: ((columna, op, (valor1, valor2, ...)), ...)
+    ordenada por columna y operador, con los valores ya convertidos (texto en
+    minúsculas, números, fechas), sin repetir y ordenados.
+
+    Cada filtro es un diccionario: {'columna': 'NombreCol', 'valor': 'ValorBuscar', 'op': 'contains'}
+    - Filtros con la MISMA columna y el mismo operador se aplican con lógica OR.
+    - Todos los demás (otra columna u otro operador) se aplican con lógica AND,
+      así "Total > 1000" y "Total < 5000" en la misma columna dan un rango.
+
+    Operadores ('op'):
+    - 'contains' (por defecto): el texto contiene el valor (literal).
+    - 'eq' / 'in': el texto es igual al valor / a alguno de la lista (sin
+      distinguir mayúsculas). 'in' acepta una lista o texto separado por comas.
+    - 'prefix': el texto empieza con el valor.
+    - 'gt', 'gte', 'lt', 'lte': comparación numérica (acepta montos '$1,234.50').
+    - 'between': [mínimo, máximo] numérico, ambos incluidos ('' = sin límite).
+    - 'date_from', 'date_to', 'date_between': rangos de fechas, ambos extremos
+      incluidos (una fecha sin hora abarca el día completo).
+
+    Dos listas de filtros con la misma forma canónica dan el mismo resultado.
+    Los filtros sin columna o sin valor se ignoran.
+
+    Raises:
+        ValueError: Si los filtros no son una lista de diccionarios, si una
+            columna no es un texto o un valor no es un texto / número (o una
+            lista de ellos), o si un filtro tiene un operador desconocido o un
+            valor que no se puede convertir (ej. 'gt' con un texto que no es número).
+    """
+    if filtros and not isinstance(filtros, (list, tuple)):
+        raise ValueError(f"Los filtros deben ser una lista, no {type(filtros).__name__}")
+    filtros_agrupados = defaultdict(set)
+    for f in filtros or []:
+        if not isinstance(f, dict):
+            raise ValueError(f"Filtro no válido (se esperaba un objeto con 'columna' y 'valor'): {f!r}")
+        if f.get('columna') is not None and not isinstance(f['columna'], str):
+            raise ValueError(f"La columna de un filtro debe ser un texto: {f['columna']!r}")
+        if not (f.get('columna') and f.get('valor') not in (None, '', [])):
+            continue
+        if not _es_valor_filtro(f['valor']):
+            raise ValueError(f"Valor no válido en la columna '{f['columna']}': {f['valor']!r}")
+        op = f.get('op') or 'contains'
+        if op not in OPERADORES:
+            raise ValueError(f"Operador de filtro desconocido '{op}' en la columna '{f['columna']}'")
+        valores = _normalizar_valor(op, f['valor'])
+        if not valores:
+            raise ValueError(f"Valor no válido para '{op}' en la columna '{f['columna']}': {f['valor']!r}")
+        filtros_agrupados[(f['columna'], op)].update(valores)
+    return tuple(
+        (columna, op, tuple(sorted(valores)))
+        for (columna, op), valores in sorted(filtros_agrupados.items(), key=lambda item: (str(item[0][0]), item[0][1]))
+    )
+
+def _es_valor_filtro(valor) -> bool:
+    """Un texto o número, o una lista de ellos (None en una lista = extremo sin límite)."""
+    if isinstance(valor, (list, tuple)):
+        return all(elemento is None or isinstance(elemento, TIPOS_VALOR) for elemento in valor)
+    return isinstance(valor, TIPOS_VALOR)
+
+def _normalizar_valor(op: str, valor) -> list:
+    """Los valores canónicos de un filtro (lista vacía si el valor no sirve para el operador)."""
+    if op == 'contains':
+        return [str(valor).lower()]
+    if op in ('eq', 'prefix'):
+        texto = str(valor).strip().lower()
+        return [texto] if texto else []
+    if op == 'in':
+        elementos = valor if isinstance(valor, (list, tuple)) else str(valor).split(',')
+        return [str(e).strip().lower() for e in elementos if str(e).strip()]
+    if op in ('between', 'date_between'):
+        # [mínimo, máximo] o el texto 'mínimo..máximo'; un extremo vacío no tiene límite
+        extremos = list(valor) if isinstance(valor, (list, tuple)) else str(valor).split('..')
+        if len(extremos) != 2:
+            return []
+        if op == 'between':
+            desde, hasta = _a_numero(extremos[0], -np.inf), _a_numero(extremos[1], np.inf)
+        else:
+            desde, hasta = _a_fecha(extremos[0], False), _a_fecha(extremos[1], True)
+        return [] if desde is None or hasta is None else [(desde, hasta)]
+    if op in OPERADORES_NUMERO:
+        numero = _a_numero(valor, None)
+        return [] if numero is None else [numero]
+    # date_from / date_to
+    fecha = _a_fecha(valor, op == 'date_to')
+    return [] if fecha is None else [fecha]
+
+def _a_numero(valor, sin_limite):
+    """Número de un valor de filtro ('$1,234.50' incluido); `sin_limite` si viene vacío, None si no es número."""
+    if valor is None or str(valor).strip() == '':
+        return sin_limite
+    numero = convertir_montos(pd.Series([str(valor).strip()], dtype=object)).iloc[0]
+    return None if pd.isna(numero) else float(numero)
+
+def _a_fecha(valor, fin: bool):
     """
-    Aplica una lista de filtros al DataFrame.
-    - Filtros en DIFERENTES columnas se aplican con lógica AND.
-    - Filtros en la MISMA columna se aplican con lógica OR.
+    Fecha de un valor de filtro en nanosegundos (int, para que sirva de clave).
+    Con `fin=True` devuelve el límite superior EXCLUSIVO: una fecha sin hora
+    abarca el día completo. Vacío = sin límite; None si no es fecha.
+    """
+    if valor is None or str(valor).strip() == '':
+        return int(np.iinfo(np.int64).max) if fin else int(np.iinfo(np.int64).min) + 1
+    fecha = a_fechas([str(valor).strip()])[0]
+    if np.isnat(fecha):
+        return None
+    fecha = pd.Timestamp(fecha)
+    if fin:
+        fecha = fecha + (pd.Timedelta(days=1) if fecha == fecha.normalize() else pd.Timedelta(1, 'ns'))
+    return int(fecha.value)
 
-    Cada filtro es un diccionario: {'columna': 'NombreCol', 'valor': 'ValorBuscar'}
+def coincide_texto(op: str, valores: tuple, texto: str) -> bool:
+    """
+    Si un texto suelto (ej. el nombre de una hoja) cumple un grupo de filtros
+    normalizado. Los operadores numéricos y de fechas no se evalúan (True).
+    """
+    texto = texto.lower()
+    if op == 'contains':
+        return any(valor in texto for valor in valores)
+    if op in ('eq', 'in'):
+        return texto.strip() in valores
+    if op == 'prefix':
+        return texto.strip().startswith(valores)
+    return True
+
+def filtrar_posiciones(df: pd.DataFrame, filtros_normalizados: tuple, posiciones: np.ndarray = None,
+                       indice=None) -> np.ndarray:
+    """
+    Aplica filtros ya normalizados (ver `normalizar_filtros`) y devuelve las
+    posiciones de las filas que los cumplen.
+
+    Si se pasan `posiciones`, solo se evalúan esas filas: sirve para partir
+    de un resultado anterior (ej. el de los mismos filtros menos una columna).
+    Con el índice, cada filtro se resuelve sobre los valores distintos y solo
+    se consultan los códigos de esas filas (no se arma la máscara completa).
+
+    Returns:
+        np.ndarray: Posiciones (de menor a mayor) de las filas que cumplen.
+    """
+    if posiciones is None:
+        posiciones = np.arange(len(df))
+
+    for columna, op, valores in filtros_normalizados:
+        if len(posiciones) == 0:
+            break
+        if columna not in df.columns:
+            print(f"Advertencia: La columna '{columna}' especificada en un filtro no existe en el archivo.")
+            continue
+        if indice is not None:
+            indice_columna = indice.columna(columna)
+            coincide = _coincide_ids(indice_columna, op, valores)[indice_columna.codigos[posiciones]]
+        else:
+            # Sin índice: solo se recorren las filas que siguen
+            subconjunto = df[columna].take(posiciones).reset_index(drop=True)
+            coincide = _mascara_filtro(subconjunto.to_frame(), columna, op, valores, None)
+        posiciones = posiciones[coincide]
+
+    return posiciones
+
+def mascara_busqueda_rapida(df: pd.DataFrame, texto: str, columnas: list = None, indice=None) -> np.ndarray:
+    """
+    Máscara de la búsqueda rápida de la tabla: filas en las que ALGUNA de
+    las `columnas` contiene `texto` (literal, sin distinguir mayúsculas).
 
     Args:
         df (pd.DataFrame): El DataFrame original.
-        filtros (list): Una lista de diccionarios de filtros.
+        texto (str): Texto a buscar.
+        columnas (list, opcional): Columnas donde buscar. Por defecto, todas.
+        indice (IndiceBusqueda, opcional): Índice de búsqueda del mismo `df`.
 
     Returns:
-        pd.DataFrame: El DataFrame filtrado.
+        np.ndarray: La máscara booleana (una posición por fila de `df`).
     """
-    
-    if not filtros: # Si no hay filtros, devuelve todo
-        return df.copy()
-
-    # --- NUEVA LÓGICA: Agrupar filtros por columna ---
-    filtros_agrupados = defaultdict(list)
-    for f in filtros:
-        # Solo consideramos filtros válidos
-        if f.get('columna') and f.get('valor'):
-             filtros_agrupados[f['columna']].append(f['valor'])
-    # Ejemplo: filtros_agrupados = {'Invoice #': ['229', '996'], 'Status': ['Pending']}
-    # ---
-
-    # Empezamos con una copia del DataFrame completo
-    resultado = df.copy()
-
-    # --- Lógica AND entre columnas diferentes ---
-    for columna, valores in filtros_agrupados.items():
-        if not valores: # Si no hay valores para esta columna, saltar
-            continue
-            
-        try:
-            # Aseguramos que la columna sea texto para la búsqueda
-            columna_texto = resultado[columna].astype(str).str.lower()
-            
-            # --- Lógica OR dentro de la misma columna ---
-            # Creamos una "máscara" booleana (True/False por fila)
-            # Inicialmente, ninguna fila cumple la condición OR
-            mascara_or_columna = pd.Series([False] * len(resultado), index=resultado.index)
-            
-            for valor in valores:
-                valor_lower = str(valor).lower()
-                # Acumulamos con OR: si ya cumplía, sigue cumpliendo.
-                # Si no cumplía pero cumple ahora, se vuelve True.
-                mascara_or_columna = mascara_or_columna | columna_texto.str.contains(valor_lower, case=False, na=False)
-            
-            # Aplicamos la máscara OR para esta columna (esto actúa como AND con los filtros anteriores)
-            resultado = resultado[mascara_or_columna]
-
-        except KeyError:
-             print(f"Advertencia: La columna '{columna}' especificada en un filtro no existe en el archivo.")
-             pass # Si la columna no existe, simplemente ignoramos ese filtro
-        except Exception as e:
-            print(f"Error inesperado al aplicar filtro en '{columna}': {e}")
-            pass
-
-    return resultado
\ No newline at end of file
+    columnas = [col for col in (columnas or df.columns) if col in df.columns]
+    mascara = np.zeros(len(df), dtype=bool)
+    for columna in columnas:
+        np.logical_or(mascara, _mascara_columna(df, columna, [texto], indice, False), out=mascara)
+    return mascara
+
+def _mascara_filtro(df: pd.DataFrame, columna, op: str, valores: tuple, indice) -> np.ndarray:
+    """Máscara de un grupo de filtros normalizado (misma columna y operador)."""
+    if op == 'contains':
+        return _mascara_columna(df, columna, valores, indice, False)
+
+    # Los demás operadores se evalúan una vez por valor distinto y se llevan
+    # a las filas con los códigos (el índice guarda los números / fechas ya convertidos)
+    indice_columna = indice.columna(columna) if indice is not None else IndiceColumna(df[columna])
+    return indice_columna.mascara_ids(_coincide_valores(indice_columna, op, valores))
+
+def _coincide_ids(indice_columna, op: str, valores: tuple) -> np.ndarray:
+    """Como `_coincide_valores`, pero también para 'contains' (con los trigramas del índice)."""
+    if op == 'contains':
+        coincide = np.zeros(len(indice_columna.textos), dtype=bool)
+        for valor in valores:
+            coincide[indice_columna.buscar(str(valor).lower())] = True
+        return coincide
+    return _coincide_valores(indice_columna, op, valores)
+
+def _coincide_valores(indice_columna, op: str, valores: tuple) -> np.ndarray:
+    """Máscara sobre los valores distintos de una columna (una posición por valor)."""
+    coincide = np.zeros(len(indice_columna.textos), dtype=bool)
+
+    if op in ('eq', 'in'):
+        # Búsqueda en el diccionario texto -> valores distintos, sin recorrer la columna
+        por_texto = indice_columna.por_texto
+        for valor in valores:
+            ids = por_texto.get(valor)
+            if ids is not None:
+                coincide[ids] = True
+    elif op == 'prefix':
+        for texto, ids in indice_columna.por_texto.items():
+            if texto.startswith(valores):
+                coincide[ids] = True
+    elif op in OPERADORES_NUMERO:
+        numeros = indice_columna.numeros  # NaN nunca cumple una comparación
+        for valor in valores:
+            if op == 'gt': coincide |= numeros > valor
+            elif op == 'gte': coincide |= numeros >= valor
+            elif op == 'lt': coincide |= numeros < valor
+            elif op == 'lte': coincide |= numeros <= valor
+            else: coincide |= (numeros >= valor[0]) & (numeros <= valor[1])
+    else:
+        fechas = indice_columna.fechas  # NaT nunca cumple una comparación
+        for valor in valores:
+            desde, hasta = (valor, None) if op == 'date_from' else (None, valor) if op == 'date_to' else valor
+            cumple = ~np.isnat(fechas)
+            if desde is not None: cumple &= fechas >= np.datetime64(desde, 'ns')
+            if hasta is not None: cumple &= fechas < np.datetime64(hasta, 'ns')
+            coincide |= cumple
+    return coincide
+
+def _mascara_columna(df: pd.DataFrame, columna, valores: list, indice, regex: bool) -> np.ndarray:
+    """Máscara OR de todos los valores buscados en una misma columna."""
+    valores_lower = [str(valor).lower() for valor in valores]
+
+    # Con el índice solo se resuelven búsquedas literales
+    if indice is not None and (not regex or not any(CARACTERES_REGEX.intersection(v) for v in valores_lower)):
+        # Cada llamada devuelve un arreglo nuevo, así que se puede modificar en el lugar
+        return indice.mascara_contiene(columna, valores_lower)
+
+    serie = df[columna]
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Columna categórica: se busca una sola vez en las categorías
+        # y el resultado se lleva a las filas con los códigos
+        categorias = pd.Series(serie.cat.categories.astype(str)).str.lower()
+        coincide = np.zeros(len(categorias) + 1, dtype=bool)  # La última posición es para los nulos (código -1)
+        for valor_lower in valores_lower:
+            np.logical_or(coincide[:-1], categorias.str.contains(valor_lower, regex=regex, na=False).to_numpy(dtype=bool), out=coincide[:-1])
+        return coincide[serie.cat.codes.to_numpy()]
+
+    # Sin índice: una pasada por valor sobre el texto en minúsculas
+    columna_texto = serie.astype(str).str.lower()
+    mascara_or_columna = np.zeros(len(df), dtype=bool)
+    for valor_lower in valores_lower:
+        coincide = columna_texto.str.contains(valor_lower, regex=regex, na=False)
+        np.logical_or(mascara_or_columna, coincide.to_numpy(dtype=bool), out=mascara_or_columna)
+    return mascara_or_columna
\ No newline at end of file
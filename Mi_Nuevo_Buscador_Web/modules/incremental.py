@@ -0,0 +1,66 @@
+"""
+incremental.py
+
+Actualización incremental de un dataset con una versión nueva del mismo
+archivo (ej. el mayor que se vuelve a subir cada día con unas cuantas
+filas más al final).
+
+- Se revisa que el esquema sea el mismo (mismas columnas, en el mismo
+  orden) y, con un hash por fila, que las filas que ya existían no hayan
+  cambiado.
+- Si todo coincide, solo las filas agregadas se limpian y se les calcula
+  '_row_status'; luego se agregan al sidecar y a las estructuras derivadas
+  (índice de búsqueda, montos...) de la versión anterior.
+- Si no, la versión nueva se procesa completa, como cualquier subida.
+
+El Excel nuevo sí se recorre completo (un .xlsx es un zip: no se puede
+saltar a las últimas filas), pero en una sola pasada y sin convertir las
+filas anteriores más allá de lo necesario para compararlas.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .loader import estado_filas
+
+
+def hash_filas(df: pd.DataFrame) -> np.ndarray:
+    """
+    Hash (uint64) del contenido de cada fila, sin contar '_row_status'.
+    No depende de cómo se guarda el texto (str, Arrow o 'category').
+    """
+    columnas = [col for col in df.columns if col != '_row_status']
+    return pd.util.hash_pandas_object(df[columnas], index=False).to_numpy()
+
+
+def filas_agregadas(df_base: pd.DataFrame, hashes_base: np.ndarray, leidas: pd.DataFrame):
+    """
+    Compara la versión nueva de un archivo con la anterior.
+
+    Args:
+        df_base (pd.DataFrame): Los datos de la versión anterior (de `cargar_datos`).
+        hashes_base (np.ndarray): `hash_filas(df_base)`.
+        leidas (pd.DataFrame): La versión nueva, de `loader.leer_filas_excel`.
+
+    Returns:
+        tuple: (filas nuevas, motivo). Las filas nuevas ya vienen limpias y
+               con '_row_status' (índice 0..k-1). Si la versión nueva no es
+               la anterior con filas agregadas al final, (None, motivo).
+    """
+    leidas.columns = [str(col).strip() for col in leidas.columns]
+    leidas = leidas.fillna("")
+
+    columnas_base = [col for col in df_base.columns if col != '_row_status']
+    if list(leidas.columns) != columnas_base:
+        return None, "las columnas no coinciden con la versión anterior"
+    if len(leidas) < len(df_base):
+        return None, f"tiene menos filas ({len(leidas)}) que la versión anterior ({len(df_base)})"
+
+    distintas = np.flatnonzero(hash_filas(leidas.iloc[:len(df_base)]) != hashes_base)
+    if len(distintas) > 0:
+        # +2: el encabezado es la fila 1 de la hoja
+        return None, f"cambiaron {len(distintas)} filas existentes (la primera es la fila {distintas[0] + 2})"
+
+    nuevas = leidas.iloc[len(df_base):].reset_index(drop=True)
+    nuevas['_row_status'] = estado_filas(nuevas)
+    return nuevas, "solo se agregaron filas"
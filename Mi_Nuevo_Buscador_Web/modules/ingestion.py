@@ -0,0 +1,224 @@
+"""
+ingestion.py
+
+Ingesta en segundo plano de los archivos subidos.
+
+/api/upload solo guarda el archivo y lee los encabezados; el parseo
+completo (`cargar_datos`) corre en un pool de hilos. Mientras tanto,
+el navegador consulta el progreso (bytes leídos, filas aproximadas) y
+las APIs de datos esperan a que la ingesta termine.
+
+Con varios procesos (workers), el estado de cada trabajo también se
+publica en `<carpeta>/<file_id>.estado.json`, para que los demás
+workers puedan consultarlo y esperar a que termine.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ErrorIngesta(Exception):
+    """La ingesta en segundo plano de un archivo falló."""
+
+
+ESTADOS_FINALES = ('listo', 'error')
+
+# Cada cuánto se reescribe el archivo de estado mientras se lee
+INTERVALO_PUBLICACION = 0.5
+
+
+class TrabajoIngesta:
+    """Estado de la ingesta de un archivo."""
+
+    def __init__(self, file_id, columnas, filas_estimadas=None, ruta_estado=None):
+        self.file_id = file_id
+        self.columnas = columnas
+        self.filas_estimadas = filas_estimadas
+        self.estado = 'pendiente'   # 'pendiente' -> 'leyendo' -> 'listo' | 'error'
+        self.bytes_leidos = 0
+        self.bytes_totales = 0
+        self.filas = None           # Filas reales, al terminar
+        self.error = None
+        self.detalle = {}           # Datos extra del cargador (ej. cómo se actualizó el dataset)
+        self.terminado = None       # time.monotonic() al terminar
+        self._evento = threading.Event()
+        self._ruta_estado = ruta_estado
+        self._publicado = 0.0
+
+    def actualizar(self, bytes_leidos, bytes_totales):
+        """Callback de progreso de `cargar_datos`."""
+        self.estado = 'leyendo'
+        self.bytes_leidos = bytes_leidos
+        self.bytes_totales = bytes_totales
+        if time.monotonic() - self._publicado >= INTERVALO_PUBLICACION:
+            self.publicar()
+
+    def publicar(self):
+        """Escribe el estado en disco (si hay ruta), para los demás procesos."""
+        if self._ruta_estado is None:
+            return
+        self._publicado = time.monotonic()
+        ruta_temporal = f"{self._ruta_estado}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(ruta_temporal, 'w', encoding='utf-8') as archivo:
+                json.dump(self.como_dict(), archivo)
+            os.replace(ruta_temporal, self._ruta_estado)
+        except OSError as e:
+            print(f"Advertencia: no se pudo publicar el estado de {self.file_id}: {e}")
+
+    def filas_leidas(self):
+        """Filas parseadas hasta ahora (aproximadas por los bytes leídos mientras se lee)."""
+        if self.filas is not None:
+            return self.filas
+        if not self.filas_estimadas or not self.bytes_totales:
+            return 0
+        return int(self.filas_estimadas * min(1.0, self.bytes_leidos / self.bytes_totales))
+
+    def como_dict(self):
+        """Estado para la API de progreso."""
+        return {
+            "file_id": self.file_id,
+            "estado": self.estado,
+            "bytes_leidos": self.bytes_leidos,
+            "bytes_totales": self.bytes_totales,
+            "filas_leidas": self.filas_leidas(),
+            "filas_estimadas": self.filas_estimadas,
+            "columnas": self.columnas,
+            "error": self.error,
+            "detalle": self.detalle,
+        }
+
+    def _terminar(self, estado, filas=None, error=None):
+        self.estado = estado
+        self.filas = filas
+        self.error = error
+        self.terminado = time.monotonic()
+        self.publicar()
+        self._evento.set()
+
+
+class GestorIngestas:
+    """
+    Pool de hilos que ingiere los archivos subidos, uno por trabajo.
+
+    - Los trabajos se buscan por `file_id`.
+    - Los trabajos terminados se olvidan después de `retencion_segundos`
+      (los datos siguen en la caché de DataFrames).
+    - Si se indica `carpeta_estado`, el estado se publica en disco y los
+      trabajos de otros procesos se consultan desde ahí.
+    """
+
+    def __init__(self, max_hilos=2, retencion_segundos=60 * 60, carpeta_estado=None):
+        self.retencion_segundos = retencion_segundos
+        self.carpeta_estado = carpeta_estado
+        self._pool = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix='ingesta')
+        self._trabajos = {}
+        self._lock = threading.Lock()
+
+    def iniciar(self, file_id, columnas, filas_estimadas, cargador):
+        """
+        Encola la ingesta de un archivo.
+
+        Args:
+            file_id (str): Identificador del archivo.
+            columnas (list): Columnas ya leídas del encabezado.
+            filas_estimadas (int | None): Filas según la dimensión de la hoja.
+            cargador (callable): Recibe el callback de progreso y devuelve el DataFrame.
+
+        Returns:
+            TrabajoIngesta: El trabajo creado.
+        """
+        trabajo = TrabajoIngesta(file_id, columnas, filas_estimadas, self._ruta_estado(file_id))
+        with self._lock:
+            self._olvidar_viejos()
+            self._trabajos[file_id] = trabajo
+        trabajo.publicar()
+        self._pool.submit(self._ejecutar, trabajo, cargador)
+        return trabajo
+
+    def anotar(self, file_id, **detalle):
+        """Agrega datos al `detalle` del trabajo de `file_id` (lo llama el cargador mientras corre)."""
+        trabajo = self.obtener(file_id)
+        if trabajo is not None:
+            trabajo.detalle.update(detalle)
+
+    def obtener(self, file_id):
+        """Devuelve el trabajo de `file_id` de ESTE proceso, o None si no hay ninguno."""
+        with self._lock:
+            return self._trabajos.get(file_id)
+
+    def estado(self, file_id):
+        """
+        Estado (dict de `TrabajoIngesta.como_dict`) de la ingesta de `file_id`:
+        el del trabajo local o, si no, el publicado en disco por otro proceso.
+
+        Returns:
+            dict | None: El estado, o None si no se conoce ninguna ingesta.
+        """
+        trabajo = self.obtener(file_id)
+        if trabajo is not None:
+            return trabajo.como_dict()
+        ruta = self._ruta_estado(file_id)
+        if ruta is None or not os.path.exists(ruta):
+            return None
+        try:
+            with open(ruta, encoding='utf-8') as archivo:
+                return json.load(archivo)
+        except (OSError, ValueError) as e:
+            print(f"Advertencia: no se pudo leer el estado de {file_id}: {e}")
+            return None
+
+    def esperar(self, file_id, timeout=None):
+        """
+        Bloquea hasta que termine la ingesta de `file_id` (si hay una),
+        ya sea de este proceso o de otro worker.
+
+        Raises:
+            ErrorIngesta: Si la ingesta falló o no terminó a tiempo.
+        """
+        trabajo = self.obtener(file_id)
+        if trabajo is not None:
+            if not trabajo._evento.wait(timeout):
+                raise ErrorIngesta("El archivo todavía se está procesando")
+            estado = trabajo.como_dict()
+        else:
+            # Trabajo de otro proceso: se consulta su estado en disco
+            limite = None if timeout is None else time.monotonic() + timeout
+            estado = self.estado(file_id)
+            while estado is not None and estado['estado'] not in ESTADOS_FINALES:
+                if limite is not None and time.monotonic() > limite:
+                    raise ErrorIngesta("El archivo todavía se está procesando")
+                time.sleep(INTERVALO_PUBLICACION / 2)
+                estado = self.estado(file_id)
+        if estado is not None and estado['estado'] == 'error':
+            raise ErrorIngesta(estado['error'])
+
+    # --- Funciones internas ---
+
+    def _ruta_estado(self, file_id):
+        if self.carpeta_estado is None:
+            return None
+        return os.path.join(self.carpeta_estado, f"{file_id}.estado.json")
+
+    def _ejecutar(self, trabajo, cargador):
+        trabajo.estado = 'leyendo'
+        try:
+            df = cargador(trabajo.actualizar)
+            if df.empty:
+                raise ErrorIngesta("File is empty or corrupt")
+            trabajo._terminar('listo', filas=len(df))
+        except Exception as e:
+            print(f"Error en la ingesta de {trabajo.file_id}: {e}")
+            trabajo._terminar('error', error=str(e))
+
+    def _olvidar_viejos(self):
+        ahora = time.monotonic()
+        viejos = [
+            file_id for file_id, trabajo in self._trabajos.items()
+            if trabajo.terminado is not None and ahora - trabajo.terminado > self.retencion_segundos
+        ]
+        for file_id in viejos:
+            del self._trabajos[file_id]
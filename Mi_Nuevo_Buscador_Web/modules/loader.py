@@ -1,69 +1,386 @@
-"""
-loader.py
-
-Módulo encargado de la carga y validación de datos
-desde un archivo Excel que contiene las facturas.
-"""
-
-"""
-loader.py
-
-Módulo encargado de la carga y validación de datos
-desde un archivo Excel que contiene las facturas.
-"""
-
-import pandas as pd
-import numpy as np  # Importamos numpy
-
-def cargar_datos(ruta_archivo: str) -> pd.DataFrame:
-    """
-    Carga un archivo Excel que contiene las facturas.
-
-    Args:
-        ruta_archivo (str): Ruta completa del archivo Excel (ej. 'data/Header_Facturas.xlsx').
-
-    Returns:
-        pd.DataFrame: Un DataFrame con los datos cargados y limpiados.
-                      Si hay error, devuelve un DataFrame vacío.
-    """
-    try:
-        # Cargar el archivo Excel usando pandas
-        df = pd.read_excel(ruta_archivo, dtype=str)
-
-        # Limpiar los encabezados de columnas (quitar espacios)
-        df.columns = [col.strip() for col in df.columns]
-
-        # Reemplazar valores nulos (NaN, NaT) por cadenas vacías
-        df = df.fillna("")
-
-        print(f" Archivo cargado correctamente con {len(df)} registros.")
-
-        # --- INICIO: LÓGICA DE "ROW STATUS" (REVISANDO TODA LA FILA) ---
-        
-        # Ya no necesitamos la lista de 'columnas_clave'.
-        # Simplemente revisamos el DataFrame completo.
-
-        # Define qué se considera "vacío" (un string vacío o un "0")
-        # Aplicamos esto a *todo* el DataFrame.
-        blank_mask = (df == "") | (df == "0")
-        
-        # Revisa fila por fila (axis=1): si *alguna* celda está vacía, marca la fila.
-        incomplete_rows = blank_mask.any(axis=1)
-        
-        # Crea la nueva columna '_row_status'
-        df['_row_status'] = np.where(
-            incomplete_rows, 
-            "Incompleto",  # Valor si la fila tiene al menos un vacío
-            "Completo"     # Valor si la fila está 100% llena
-        )
-        # --- FIN DEL BLOQUE ---
-
-        return df
-
-    except FileNotFoundError:
-        print(f" Error: No se encontró el archivo en la ruta: {ruta_archivo}")
-        return pd.DataFrame()
-    except Exception as e:
-        # Esto capturará errores si el archivo no es un Excel válido
-        print(f" Error al cargar el archivo Excel: {e}")
-        return pd.DataFrame()
\ No newline at end of file
+"""
+loader.py
+
+Módulo encargado de la carga y validación de datos
+desde un archivo Excel que contiene las facturas.
+"""
+
+"""
+loader.py
+
+Módulo encargado de la carga y validación de datos
+desde un archivo Excel que contiene las facturas.
+"""
+
+import os
+import pandas as pd
+import numpy as np  # Importamos numpy
+
+from pandas.errors import EmptyDataError
+from pandas.io.parsers import TextParser
+
+# pyarrow es opcional: sin él se lee siempre el Excel
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+    feather = None
+
+
+def ruta_sidecar(ruta_archivo: str, hoja: int = 0) -> str:
+    """Devuelve la ruta del archivo columnar (Arrow) que acompaña al Excel (una por hoja)."""
+    base = os.path.splitext(ruta_archivo)[0]
+    return f"{base}.arrow" if hoja == 0 else f"{base}.h{hoja}.arrow"
+
+
+def _sidecar_vigente(ruta_archivo: str, ruta_columnar: str) -> bool:
+    """El sidecar sirve si existe y no es más viejo que el Excel."""
+    if not os.path.exists(ruta_columnar):
+        return False
+    return os.path.getmtime(ruta_columnar) >= os.path.getmtime(ruta_archivo)
+
+
+# pandas >= 3 ya convierte el texto de Arrow sin copiar (dtype 'str'); en versiones
+# anteriores se pide explícitamente el StringDtype de Arrow para no crear objetos de Python
+_TEXTO_ARROW = None
+if pa is not None and pd.Series(["a"]).dtype == object:
+    _TEXTO_ARROW = pd.StringDtype(storage="pyarrow")
+
+
+def _tipo_pandas(tipo_arrow):
+    """types_mapper de `to_pandas`: el texto queda respaldado por los buffers de Arrow."""
+    if pa.types.is_string(tipo_arrow) or pa.types.is_large_string(tipo_arrow):
+        return _TEXTO_ARROW
+    return None
+
+
+def _leer_sidecar(ruta_columnar: str) -> pd.DataFrame:
+    """
+    Lee el sidecar Arrow mapeándolo en memoria (memory-map), sin copiar
+    los datos: las columnas de texto apuntan a las páginas del archivo,
+    que el sistema operativo comparte entre todos los procesos (workers).
+    """
+    with pa.memory_map(ruta_columnar, "r") as origen:
+        tabla = pa.ipc.open_file(origen).read_all()
+    return tabla.to_pandas(types_mapper=_tipo_pandas)
+
+
+def _escribir_sidecar(df: pd.DataFrame, ruta_columnar: str) -> None:
+    """
+    Escribe el DataFrame ya limpio como Arrow IPC (Feather v2) sin comprimir,
+    para que se pueda mapear en memoria sin descomprimir.
+    """
+    ruta_temporal = f"{ruta_columnar}.{os.getpid()}.tmp"
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    feather.write_feather(tabla, ruta_temporal, compression="uncompressed")
+    os.replace(ruta_temporal, ruta_columnar)  # Atómico: nadie lee un archivo a medias
+
+
+class _ArchivoConProgreso:
+    """
+    Envuelve un archivo binario y avisa cuántos bytes se han leído.
+    openpyxl (modo read_only) lee la hoja a medida que la recorre,
+    así que los bytes leídos avanzan junto con las filas.
+    """
+
+    def __init__(self, archivo, progreso):
+        self._archivo = archivo
+        self._progreso = progreso
+        self._total = os.fstat(archivo.fileno()).st_size
+        self._leidos = 0
+
+    def read(self, n=-1):
+        datos = self._archivo.read(n)
+        # Se cuentan los bytes leídos (no la posición: zip salta al final del archivo)
+        self._leidos = min(self._total, self._leidos + len(datos))
+        self._progreso(self._leidos, self._total)
+        return datos
+
+    def __getattr__(self, nombre):
+        # seek, tell, seekable... se delegan al archivo real
+        return getattr(self._archivo, nombre)
+
+
+def leer_encabezados(ruta_archivo: str, hoja: int = 0):
+    """
+    Lee solo la fila de encabezados de una hoja del Excel (sin parsear los datos).
+
+    Returns:
+        tuple: (columnas, filas_estimadas). Las columnas ya vienen limpias e
+               incluyen '_row_status', igual que las de `cargar_datos`.
+               `filas_estimadas` sale de la dimensión de la hoja (None si
+               el archivo no la trae).
+    """
+    with pd.ExcelFile(ruta_archivo, engine="openpyxl") as libro:
+        return _encabezados_hoja(libro, hoja)
+
+
+def leer_hojas(ruta_archivo: str) -> list:
+    """
+    Lee los encabezados de TODAS las hojas del Excel (sin parsear los datos).
+
+    Returns:
+        list: Un diccionario por hoja con datos: {'hoja': índice, 'nombre',
+              'columnas', 'filas_estimadas'}. Las hojas vacías se omiten.
+    """
+    hojas = []
+    with pd.ExcelFile(ruta_archivo, engine="openpyxl") as libro:
+        for indice, nombre in enumerate(libro.sheet_names):
+            columnas, filas_estimadas = _encabezados_hoja(libro, indice)
+            if len(columnas) > 1:  # Más que solo '_row_status'
+                hojas.append({
+                    'hoja': indice, 'nombre': nombre,
+                    'columnas': columnas, 'filas_estimadas': filas_estimadas
+                })
+    return hojas
+
+
+def _encabezados_hoja(libro: pd.ExcelFile, hoja: int):
+    # La dimensión se lee antes de parsear (pandas la reinicia al leer)
+    max_fila = libro.book.worksheets[hoja].max_row
+    encabezados = libro.parse(hoja, nrows=0, dtype=str)
+    columnas = [str(col).strip() for col in encabezados.columns] + ['_row_status']
+    filas_estimadas = max_fila - 1 if max_fila else None
+    return columnas, filas_estimadas
+
+
+# --- Modo compacto ---
+# Una columna se vuelve 'category' si tiene pocos valores distintos
+# (proveedor, estado, moneda, fechas...) comparado con su número de filas.
+PROPORCION_MAX_CATEGORIA = 0.5
+ESTADOS_FILA = ["Completo", "Incompleto"]
+
+
+def compactar_datos(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convierte el DataFrame a una representación compacta en memoria:
+    - Columnas con pocos valores distintos -> 'category' (códigos + diccionario).
+    - El resto del texto -> strings respaldados por Arrow (si pyarrow está instalado).
+    - '_row_status' -> 'category' con las categorías "Completo"/"Incompleto".
+
+    Los valores (el texto) no cambian, solo cómo se guardan.
+    """
+    columnas = {}
+    for col in df.columns:
+        serie = df[col]
+        if col == '_row_status':
+            columnas[col] = serie.astype(pd.CategoricalDtype(ESTADOS_FILA))
+        elif serie.nunique() <= max(1, PROPORCION_MAX_CATEGORIA * len(serie)):
+            columnas[col] = serie.astype('category')
+        elif pa is not None:
+            columnas[col] = serie.astype(pd.StringDtype(storage="pyarrow"))
+        else:
+            columnas[col] = serie
+    return pd.DataFrame(columnas, index=df.index)
+
+
+def cargar_datos(ruta_archivo: str, usar_sidecar: bool = True, compacto: bool = False,
+                 progreso=None, hoja: int = 0) -> pd.DataFrame:
+    """
+    Carga un archivo Excel que contiene las facturas.
+
+    La primera vez se lee el Excel y se guarda un sidecar columnar (.arrow)
+    con los datos ya limpios (incluida '_row_status'). Las siguientes cargas
+    se hacen desde ese sidecar, sin volver a leer el Excel.
+
+    Args:
+        ruta_archivo (str): Ruta completa del archivo Excel (ej. 'data/Header_Facturas.xlsx').
+        usar_sidecar (bool): Si es False, ignora el sidecar y lee siempre el Excel.
+        compacto (bool): Si es True, devuelve el DataFrame en modo compacto
+            (ver `compactar_datos`). El sidecar siempre guarda el texto normal.
+        progreso (callable, opcional): Se llama con (bytes_leidos, bytes_totales)
+            mientras se lee el Excel.
+        hoja (int): Índice de la hoja a leer (por defecto, la primera).
+
+    Returns:
+        pd.DataFrame: Un DataFrame con los datos cargados y limpiados.
+                      Si hay error, devuelve un DataFrame vacío.
+    """
+    usar_sidecar = usar_sidecar and pa is not None
+    ruta_columnar = ruta_sidecar(ruta_archivo, hoja)
+
+    if usar_sidecar and os.path.exists(ruta_archivo) and _sidecar_vigente(ruta_archivo, ruta_columnar):
+        try:
+            df = _leer_sidecar(ruta_columnar)
+            print(f" Archivo cargado desde sidecar columnar con {len(df)} registros.")
+            return compactar_datos(df) if compacto else df
+        except Exception as e:
+            # Si el sidecar está dañado, volvemos a leer el Excel
+            print(f" Advertencia: no se pudo leer el sidecar {ruta_columnar}: {e}")
+
+    try:
+        # Cargar el archivo Excel usando pandas
+        if progreso is None:
+            df = pd.read_excel(ruta_archivo, dtype=str, sheet_name=hoja)
+        else:
+            with open(ruta_archivo, "rb") as archivo:
+                df = pd.read_excel(_ArchivoConProgreso(archivo, progreso), dtype=str, engine="openpyxl", sheet_name=hoja)
+
+        return preparar_datos(df, ruta_archivo, hoja, usar_sidecar=usar_sidecar, compacto=compacto)
+
+    except FileNotFoundError:
+        print(f" Error: No se encontró el archivo en la ruta: {ruta_archivo}")
+        return pd.DataFrame()
+    except Exception as e:
+        # Esto capturará errores si el archivo no es un Excel válido
+        print(f" Error al cargar el archivo Excel: {e}")
+        return pd.DataFrame()
+
+
+def estado_filas(df: pd.DataFrame) -> np.ndarray:
+    """
+    Valores de '_row_status' de cada fila: "Incompleto" si alguna celda está
+    vacía o es "0", "Completo" si la fila está 100% llena.
+    """
+    # Define qué se considera "vacío" (un string vacío o un "0")
+    # Aplicamos esto a *todo* el DataFrame.
+    blank_mask = (df == "") | (df == "0")
+
+    # Revisa fila por fila (axis=1): si *alguna* celda está vacía, marca la fila.
+    incomplete_rows = blank_mask.any(axis=1)
+
+    return np.where(
+        incomplete_rows,
+        "Incompleto",  # Valor si la fila tiene al menos un vacío
+        "Completo"     # Valor si la fila está 100% llena
+    )
+
+
+def preparar_datos(df: pd.DataFrame, ruta_archivo: str, hoja: int = 0, usar_sidecar: bool = True,
+                   compacto: bool = False) -> pd.DataFrame:
+    """
+    Limpia las filas leídas del Excel (como texto) y calcula '_row_status'.
+    Guarda el sidecar columnar del archivo (ver `cargar_datos`).
+    """
+    usar_sidecar = usar_sidecar and pa is not None
+
+    # Limpiar los encabezados de columnas (quitar espacios)
+    df.columns = [col.strip() for col in df.columns]
+
+    # Reemplazar valores nulos (NaN, NaT) por cadenas vacías
+    df = df.fillna("")
+
+    print(f" Archivo cargado correctamente con {len(df)} registros.")
+
+    # Crea la nueva columna '_row_status' (revisando toda la fila)
+    df['_row_status'] = estado_filas(df)
+
+    if usar_sidecar and not df.empty:
+        ruta_columnar = ruta_sidecar(ruta_archivo, hoja)
+        try:
+            _escribir_sidecar(df, ruta_columnar)
+            # Nos quedamos con la versión mapeada en memoria: así este proceso
+            # comparte las mismas páginas que los demás workers
+            df = _leer_sidecar(ruta_columnar)
+        except Exception as e:
+            # No es grave: la próxima carga volverá a leer el Excel
+            print(f" Advertencia: no se pudo escribir el sidecar {ruta_columnar}: {e}")
+
+    return compactar_datos(df) if compacto else df
+
+
+# --- Lectura en una sola pasada (actualizaciones incrementales) ---
+
+def leer_filas_excel(ruta_archivo: str, hoja: int = 0, progreso=None) -> pd.DataFrame:
+    """
+    Lee una hoja del Excel como texto, con el mismo resultado que
+    `pd.read_excel(dtype=str)` (mismos valores, vacíos y encabezados), pero
+    recorriendo la hoja una sola vez con openpyxl (`values_only`), sin crear
+    un objeto por celda.
+
+    Diferencia conocida: una celda de TEXTO que sea exactamente un código de
+    error de Excel (ej. "#DIV/0!") se toma como vacía, igual que las celdas
+    con error.
+
+    Args:
+        ruta_archivo (str): Ruta del archivo Excel.
+        hoja (int): Índice de la hoja.
+        progreso (callable, opcional): Se llama con (bytes_leidos, bytes_totales).
+
+    Returns:
+        pd.DataFrame: Las filas como texto (NaN en los vacíos), sin limpiar.
+    """
+    import openpyxl
+    from openpyxl.cell.cell import ERROR_CODES
+
+    with open(ruta_archivo, "rb") as archivo:
+        origen = archivo if progreso is None else _ArchivoConProgreso(archivo, progreso)
+        libro = openpyxl.load_workbook(origen, read_only=True, data_only=True, keep_links=False)
+        try:
+            hoja_excel = libro.worksheets[hoja]
+            hoja_excel.reset_dimensions()  # Igual que pandas: no se confía en la dimensión guardada
+            datos, ultima_con_datos = [], -1
+            for numero, fila in enumerate(hoja_excel.iter_rows(values_only=True)):
+                fila = [_celda_como_pandas(valor, ERROR_CODES) for valor in fila]
+                while fila and fila[-1] == "":
+                    fila.pop()  # Celdas vacías al final de la fila
+                if fila:
+                    ultima_con_datos = numero
+                datos.append(fila)
+        finally:
+            libro.close()
+
+    datos = datos[:ultima_con_datos + 1]  # Filas vacías al final de la hoja
+    if datos:
+        ancho = max(len(fila) for fila in datos)
+        datos = [fila + [""] * (ancho - len(fila)) for fila in datos]
+    try:
+        # El mismo parser (y las mismas opciones) que usa read_excel
+        return TextParser(datos, header=0, dtype=str, skip_blank_lines=False).read()
+    except EmptyDataError:
+        return pd.DataFrame()
+
+
+def _celda_como_pandas(valor, codigos_error):
+    """Convierte el valor de una celda como lo hace el lector openpyxl de pandas."""
+    if valor is None:
+        return ""
+    if isinstance(valor, str):
+        return np.nan if valor in codigos_error else valor
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        entero = int(valor)
+        return entero if entero == valor else float(valor)
+    return valor
+
+
+def anexar_filas(df_base: pd.DataFrame, nuevas: pd.DataFrame, ruta_base: str, ruta_archivo: str,
+                 hoja: int = 0, compacto: bool = False) -> pd.DataFrame:
+    """
+    DataFrame de una versión nueva de un archivo que solo agregó filas al
+    final: las filas ya limpias de la versión anterior más las `nuevas`
+    (ya limpias y con '_row_status'), sin volver a procesar las anteriores.
+
+    El sidecar de la versión nueva se arma juntando el de la anterior
+    (mapeado en memoria) con las filas nuevas.
+
+    Args:
+        df_base (pd.DataFrame): Los datos de la versión anterior (de `cargar_datos`).
+        nuevas (pd.DataFrame): Las filas agregadas, con las mismas columnas.
+        ruta_base (str): Ruta del Excel de la versión anterior.
+        ruta_archivo (str): Ruta del Excel de la versión nueva.
+        hoja (int): Índice de la hoja (la misma en las dos versiones).
+        compacto (bool): Devolver el resultado en modo compacto.
+
+    Returns:
+        pd.DataFrame: Todas las filas (índice 0..n-1).
+    """
+    ruta_columnar_base = ruta_sidecar(ruta_base, hoja)
+    if pa is not None and os.path.exists(ruta_columnar_base):
+        try:
+            with pa.memory_map(ruta_columnar_base, "r") as origen:
+                tabla_base = pa.ipc.open_file(origen).read_all()
+            tabla_nuevas = pa.Table.from_pandas(nuevas, schema=tabla_base.schema, preserve_index=False)
+            ruta_columnar = ruta_sidecar(ruta_archivo, hoja)
+            ruta_temporal = f"{ruta_columnar}.{os.getpid()}.tmp"
+            feather.write_feather(pa.concat_tables([tabla_base, tabla_nuevas]), ruta_temporal,
+                                  compression="uncompressed")
+            os.replace(ruta_temporal, ruta_columnar)
+            df = _leer_sidecar(ruta_columnar)
+            return compactar_datos(df) if compacto else df
+        except Exception as e:
+            print(f" Advertencia: no se pudo ampliar el sidecar {ruta_columnar_base}: {e}")
+
+    # Sin sidecar: se juntan los DataFrames (la próxima carga leerá el Excel completo)
+    df = pd.concat([df_base, nuevas], ignore_index=True)
+    return compactar_datos(df) if compacto else df
@@ -0,0 +1,308 @@
+"""
+metrics.py
+
+Instrumentación de las peticiones:
+
+- Cada petición lleva una `MedicionPeticion` (en `flask.g`) donde se suman
+  los tiempos de sus etapas (`with etapa('filter'): ...`) y datos sueltos
+  (`anotar(filas_salida=...)`): filas, aciertos de caché, etc.
+- Al terminar, la medición va al `RegistroMetricas` del proceso, que
+  acumula contadores e histogramas de latencia por ruta y por etapa y los
+  expone en el formato de texto de Prometheus.
+
+Fuera de una petición (ej. la ingesta en segundo plano o los hilos que
+procesan partes) `etapa` y `anotar` no hacen nada.
+
+Con varios workers (gunicorn) cada proceso tiene su propio registro: cada
+scrape de /api/metrics ve solo el worker que lo atendió.
+
+`Perfilador` perfila una sola petición a pedido: pyinstrument (muestreo)
+si está instalado, si no cProfile de la biblioteca estándar.
+"""
+
+import itertools
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+
+# resource solo existe en Unix
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# pyinstrument es opcional (perfilador por muestreo)
+try:
+    from pyinstrument import Profiler as ProfilerMuestreo
+except ImportError:
+    ProfilerMuestreo = None
+
+# Límites (en segundos) de los buckets de los histogramas
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Claves de las estadísticas de cachés / almacén que son contadores (solo crecen)
+CONTADORES_ESTADISTICAS = {
+    'aciertos', 'fallos', 'derivados', 'expulsiones', 'expiraciones', 'invalidaciones',
+    'subidas', 'deduplicadas', 'expirados', 'borrados_por_cuota',
+}
+
+
+class MedicionPeticion:
+    """Tiempos por etapa y datos de una sola petición."""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.etapas = {}  # nombre -> segundos (en el orden en que aparecieron)
+        self.datos = {}
+
+    def sumar_etapa(self, nombre: str, segundos: float):
+        self.etapas[nombre] = self.etapas.get(nombre, 0.0) + segundos
+
+    def transcurrido(self) -> float:
+        return time.perf_counter() - self.inicio
+
+    def server_timing(self, total: float) -> str:
+        """Valor del encabezado Server-Timing (milisegundos por etapa, más el total)."""
+        partes = [f"{nombre};dur={segundos * 1000:.1f}" for nombre, segundos in self.etapas.items()]
+        partes.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(partes)
+
+
+def medicion_actual():
+    """La medición de la petición en curso, o None fuera de una petición."""
+    if has_request_context():
+        return g.get('medicion')
+    return None
+
+
+@contextmanager
+def etapa(nombre: str):
+    """Suma el tiempo del bloque a la etapa `nombre` de la petición en curso."""
+    medicion = medicion_actual()
+    if medicion is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        medicion.sumar_etapa(nombre, time.perf_counter() - inicio)
+
+
+def anotar(**datos):
+    """Agrega datos (filas, caché...) a la medición de la petición en curso."""
+    medicion = medicion_actual()
+    if medicion is not None:
+        medicion.datos.update(datos)
+
+
+class Histograma:
+    """Histograma acumulado al estilo de Prometheus (buckets, suma y conteo)."""
+
+    def __init__(self, buckets=BUCKETS_SEGUNDOS):
+        self.buckets = buckets
+        self.conteos = [0] * (len(buckets) + 1)  # El último es +Inf
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float):
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                self.conteos[i] += 1
+                break
+        else:
+            self.conteos[-1] += 1
+        self.suma += valor
+        self.total += 1
+
+    def lineas(self, nombre: str, etiquetas: dict) -> list:
+        lineas, acumulado = [], 0
+        for limite, conteo in zip(list(self.buckets) + [math.inf], self.conteos):
+            acumulado += conteo
+            le = '+Inf' if limite == math.inf else f'{limite:g}'
+            lineas.append(f"{nombre}_bucket{_etiquetas(dict(etiquetas, le=le))} {acumulado}")
+        lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {self.suma:.6f}")
+        lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {self.total}")
+        return lineas
+
+
+class RegistroMetricas:
+    """Métricas acumuladas del proceso (thread-safe)."""
+
+    def __init__(self, buckets=BUCKETS_SEGUNDOS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._peticiones = defaultdict(int)   # (ruta, método, estado) -> conteo
+        self._latencias = {}                  # ruta -> Histograma
+        self._etapas = {}                     # (ruta, etapa) -> Histograma
+        self._bytes = defaultdict(int)        # ruta -> bytes enviados
+        self._filas = defaultdict(int)        # (ruta, 'entrada' | 'salida') -> filas
+
+    def registrar(self, ruta: str, metodo: str, estado: int, medicion: MedicionPeticion,
+                  segundos: float, bytes_respuesta: int = None):
+        """Acumula una petición terminada."""
+        with self._lock:
+            self._peticiones[(ruta, metodo, estado)] += 1
+            self._histograma(self._latencias, ruta).observar(segundos)
+            for nombre, duracion in medicion.etapas.items():
+                self._histograma(self._etapas, (ruta, nombre)).observar(duracion)
+            if bytes_respuesta:
+                self._bytes[ruta] += bytes_respuesta
+            for tipo in ('entrada', 'salida'):
+                filas = medicion.datos.get(f'filas_{tipo}')
+                if filas is not None:
+                    self._filas[(ruta, tipo)] += int(filas)
+
+    def exposicion(self, adicionales: list = ()) -> str:
+        """
+        Las métricas en el formato de texto de Prometheus.
+
+        Args:
+            adicionales (list): Métricas extra calculadas al momento, como
+                (nombre, tipo, ayuda, [(etiquetas, valor), ...]).
+        """
+        with self._lock:
+            lineas = []
+            _encabezado(lineas, 'buscador_peticiones_total', 'counter', 'Peticiones atendidas')
+            for (ruta, metodo, estado), conteo in sorted(self._peticiones.items()):
+                lineas.append(f"buscador_peticiones_total{_etiquetas({'ruta': ruta, 'metodo': metodo, 'estado': estado})} {conteo}")
+
+            _encabezado(lineas, 'buscador_duracion_peticion_segundos', 'histogram', 'Latencia de las peticiones por ruta')
+            for ruta, histograma in sorted(self._latencias.items()):
+                lineas.extend(histograma.lineas('buscador_duracion_peticion_segundos', {'ruta': ruta}))
+
+            _encabezado(lineas, 'buscador_duracion_etapa_segundos', 'histogram', 'Duración de cada etapa (parse, filter, serialize...) por ruta')
+            for (ruta, nombre), histograma in sorted(self._etapas.items()):
+                lineas.extend(histograma.lineas('buscador_duracion_etapa_segundos', {'ruta': ruta, 'etapa': nombre}))
+
+            _encabezado(lineas, 'buscador_bytes_respuesta_total', 'counter', 'Bytes enviados por ruta')
+            for ruta, total in sorted(self._bytes.items()):
+                lineas.append(f"buscador_bytes_respuesta_total{_etiquetas({'ruta': ruta})} {total}")
+
+            _encabezado(lineas, 'buscador_filas_total', 'counter', 'Filas leídas (entrada) y devueltas (salida) por ruta')
+            for (ruta, tipo), total in sorted(self._filas.items()):
+                lineas.append(f"buscador_filas_total{_etiquetas({'ruta': ruta, 'tipo': tipo})} {total}")
+
+        if resource is not None:
+            # Linux da ru_maxrss en KB
+            pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            adicionales = list(adicionales) + [
+                ('buscador_rss_pico_bytes', 'gauge', 'Pico de memoria residente del proceso', [({}, pico)])
+            ]
+        for nombre, tipo, ayuda, muestras in adicionales:
+            _encabezado(lineas, nombre, tipo, ayuda)
+            for etiquetas, valor in muestras:
+                lineas.append(f"{nombre}{_etiquetas(etiquetas)} {valor}")
+        return "\n".join(lineas) + "\n"
+
+    def _histograma(self, histogramas: dict, clave) -> Histograma:
+        histograma = histogramas.get(clave)
+        if histograma is None:
+            histograma = histogramas[clave] = Histograma(self.buckets)
+        return histograma
+
+
+class Perfilador:
+    """
+    Perfil de una petición a la vez, guardado como archivo en `carpeta`:
+    '.html' con pyinstrument o '.prof' (cProfile, para snakeviz / pstats).
+    Si ya hay otra petición perfilándose, la nueva no se perfila.
+    """
+
+    def __init__(self, carpeta: str):
+        self.carpeta = carpeta
+        self._lock = threading.Lock()
+        self._secuencia = itertools.count(1)
+        os.makedirs(carpeta, exist_ok=True)
+
+    def iniciar(self):
+        """Empieza a perfilar el hilo actual. None si ya hay otro perfil en curso."""
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            if ProfilerMuestreo is not None:
+                perfil = ProfilerMuestreo()
+                perfil.start()
+            else:
+                import cProfile
+                perfil = cProfile.Profile()
+                perfil.enable()
+            return perfil
+        except Exception as e:
+            self._lock.release()
+            print(f"Advertencia: No se pudo iniciar el perfilador: {e}")
+            return None
+
+    def nombre_archivo(self, ruta: str) -> str:
+        """Nombre (único) del archivo del perfil de una petición a `ruta`."""
+        extension = 'html' if ProfilerMuestreo is not None else 'prof'
+        nombre = ruta.strip('/').replace('/', '_').replace('<', '').replace('>', '') or 'inicio'
+        return f"{time.strftime('%Y%m%d-%H%M%S')}_{nombre}_{os.getpid()}-{next(self._secuencia)}.{extension}"
+
+    def detener(self, perfil, archivo: str) -> bool:
+        """Detiene el perfil y lo guarda en `carpeta/archivo`. False si no se pudo guardar."""
+        ruta = os.path.join(self.carpeta, archivo)
+        try:
+            if ProfilerMuestreo is not None:
+                perfil.stop()
+                with open(ruta, 'w', encoding='utf-8') as f:
+                    f.write(perfil.output_html())
+            else:
+                perfil.disable()
+                perfil.dump_stats(ruta)
+            return True
+        except Exception as e:
+            print(f"Advertencia: No se pudo guardar el perfil: {e}")
+            return False
+        finally:
+            self._lock.release()
+
+
+def metricas_de_estadisticas(prefijo: str, etiquetas: dict, estadisticas: dict) -> list:
+    """
+    Convierte un diccionario de `estadisticas()` (cachés, almacén) en métricas
+    adicionales para `RegistroMetricas.exposicion`: los contadores como
+    '<prefijo>_<clave>_total' y el resto como gauges.
+    """
+    metricas = []
+    for clave, valor in sorted(estadisticas.items()):
+        if not isinstance(valor, (int, float)) or isinstance(valor, bool):
+            continue
+        if clave in CONTADORES_ESTADISTICAS:
+            metricas.append((f"{prefijo}_{clave}_total", 'counter', clave, [(etiquetas, valor)]))
+        else:
+            metricas.append((f"{prefijo}_{clave}", 'gauge', clave, [(etiquetas, valor)]))
+    return metricas
+
+
+def agrupar_metricas(metricas: list) -> list:
+    """Junta las muestras de métricas con el mismo nombre (ej. la misma medida de varias cachés)."""
+    juntas = {}
+    for nombre, tipo, ayuda, muestras in metricas:
+        if nombre in juntas:
+            juntas[nombre][3].extend(muestras)
+        else:
+            juntas[nombre] = (nombre, tipo, ayuda, list(muestras))
+    return list(juntas.values())
+
+
+def _encabezado(lineas: list, nombre: str, tipo: str, ayuda: str):
+    lineas.append(f"# HELP {nombre} {ayuda}")
+    lineas.append(f"# TYPE {nombre} {tipo}")
+
+
+def _etiquetas(etiquetas: dict) -> str:
+    if not etiquetas:
+        return ""
+    pares = ",".join(f'{clave}="{_escapar(valor)}"' for clave, valor in etiquetas.items())
+    return "{" + pares + "}"
+
+
+def _escapar(valor) -> str:
+    """Escapa un valor de etiqueta (barra invertida, comillas y saltos de línea)."""
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
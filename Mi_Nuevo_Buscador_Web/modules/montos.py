@@ -0,0 +1,35 @@
+"""
+montos.py
+
+Funciones de ayuda para la columna de monto de las facturas
+(la que se llama 'Total', 'Monto', 'Amount', etc.).
+"""
+
+import numpy as np
+import pandas as pd
+
+# Lista de posibles nombres (en minúsculas)
+POSSIBLE_NAMES = ['monto', 'total', 'amount', 'total amount']
+
+def encontrar_columna_monto(df: pd.DataFrame):
+    """Intenta encontrar la columna de monto en el DataFrame."""
+    for col in df.columns:
+        if str(col).lower() in POSSIBLE_NAMES:
+            return col # Devuelve el nombre original de la columna
+    return None # No se encontró
+
+def convertir_montos(serie: pd.Series) -> pd.Series:
+    """
+    Convierte una columna de montos en texto (ej. '$1,234.50') a números.
+    Los valores que no se pueden convertir quedan como NaN.
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Se convierte cada categoría una sola vez y se reparte con los códigos
+        numeros = convertir_montos(pd.Series(serie.cat.categories)).to_numpy(dtype=float)
+        codigos = serie.cat.codes.to_numpy()
+        valores = np.where(codigos >= 0, numeros[codigos], np.nan)
+        return pd.Series(valores, index=serie.index, name=serie.name)
+
+    # La convertimos a string, quitamos '$' y ',' y LUEGO a numérico
+    serie_limpia = serie.astype(str).str.replace(r'[$,]', '', regex=True)
+    return pd.to_numeric(serie_limpia, errors='coerce')
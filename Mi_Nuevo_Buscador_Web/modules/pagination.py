@@ -0,0 +1,82 @@
+"""
+pagination.py
+
+Ordenamiento y paginación del lado del servidor para /api/filter.
+Todo trabaja con POSICIONES de filas (np.ndarray), así que solo se
+materializan las filas de la página que se devuelve.
+"""
+
+import numpy as np
+import pandas as pd
+
+from modules.montos import convertir_montos
+
+def ordenar_posiciones(df: pd.DataFrame, posiciones: np.ndarray, columna, direccion: str = 'asc',
+                       columna_monto=None, montos: np.ndarray = None) -> np.ndarray:
+    """
+    Ordena las posiciones de filas según los valores de `columna`.
+
+    - La columna de monto se ordena como número (quitando '$' y ',').
+    - Las demás columnas se ordenan como texto, sin distinguir mayúsculas.
+    - Los valores vacíos o no numéricos quedan al final.
+
+    Args:
+        df (pd.DataFrame): El DataFrame original.
+        posiciones (np.ndarray): Posiciones de las filas a ordenar.
+        columna (str): Columna por la que se ordena. Si es None o no existe, no se ordena.
+        direccion (str): 'asc' o 'desc'.
+        columna_monto (str, opcional): Nombre de la columna de monto del archivo.
+        montos (np.ndarray, opcional): La columna de monto ya convertida a número
+            (todas las filas de `df`).
+
+    Returns:
+        np.ndarray: Las mismas posiciones, en el nuevo orden.
+    """
+    if not columna or columna not in df.columns or len(posiciones) == 0:
+        return posiciones
+
+    clave = clave_orden(df, posiciones, columna, columna_monto, montos)
+    return posiciones[orden_por_clave(clave, direccion)]
+
+def clave_orden(df: pd.DataFrame, posiciones: np.ndarray, columna, columna_monto=None,
+                montos: np.ndarray = None) -> pd.Series:
+    """
+    Valores por los que se ordenan las filas en `posiciones` (índice 0..n-1):
+    números para la columna de monto, texto en minúsculas para las demás.
+    Si la columna no existe en `df`, todas las filas quedan vacías.
+    """
+    if columna == columna_monto and montos is not None:
+        return pd.Series(montos[posiciones])
+    if columna not in df.columns:
+        return pd.Series(np.nan if columna == columna_monto else "", index=range(len(posiciones)))
+    if columna == columna_monto:
+        return convertir_montos(df[columna].take(posiciones).reset_index(drop=True))
+    return df[columna].take(posiciones).reset_index(drop=True).astype(str).str.lower()
+
+def orden_por_clave(clave: pd.Series, direccion: str = 'asc') -> np.ndarray:
+    """Permutación (estable, vacíos al final) que ordena `clave`."""
+    return clave.sort_values(
+        ascending=(direccion != 'desc'), kind='stable', na_position='last'
+    ).index.to_numpy()
+
+def leer_paginacion(data: dict):
+    """
+    Lee 'offset' y 'limit' de la petición.
+    Un `limit` ausente (o None) significa "todas las filas".
+    """
+    try:
+        offset = max(int(data.get('offset') or 0), 0)
+    except (TypeError, ValueError):
+        offset = 0
+    try:
+        limit = data.get('limit')
+        limit = max(int(limit), 0) if limit is not None else None
+    except (TypeError, ValueError):
+        limit = None
+    return offset, limit
+
+def pagina(posiciones: np.ndarray, offset: int, limit) -> np.ndarray:
+    """Devuelve las posiciones de la página pedida."""
+    if limit is None:
+        return posiciones[offset:]
+    return posiciones[offset:offset + limit]
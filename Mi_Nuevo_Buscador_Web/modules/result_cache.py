@@ -0,0 +1,107 @@
+"""
+result_cache.py
+
+Caché (por proceso) de resultados de consultas: posiciones de filas que
+cumplen un conjunto de filtros, resultados agrupados, etc.
+
+Las claves las arma quien llama (ej. file_id + forma canónica de los
+filtros). El tamaño total está limitado en bytes y se expulsan primero
+las entradas usadas hace más tiempo (LRU).
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+class CacheResultados:
+    """Caché LRU de resultados con límite de memoria."""
+
+    def __init__(self, max_bytes=128 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entradas = OrderedDict()  # clave -> (valor, tamaño)
+        self._bytes_usados = 0
+        self._lock = threading.Lock()
+
+        # Contadores
+        self.aciertos = 0
+        self.fallos = 0
+        self.derivados = 0    # Resultados calculados a partir de un resultado "padre"
+        self.expulsiones = 0
+
+    def obtener(self, clave, contar=True):
+        """Devuelve el valor guardado para `clave`, o None si no existe."""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                if contar:
+                    self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            if contar:
+                self.aciertos += 1
+            return entrada[0]
+
+    def guardar(self, clave, valor):
+        """
+        Guarda `valor` en la caché. Los arreglos de NumPy se marcan como de
+        solo lectura, porque se comparten entre peticiones.
+        """
+        for parte in (valor if isinstance(valor, tuple) else (valor,)):
+            if isinstance(parte, np.ndarray):
+                parte.flags.writeable = False
+        tamano = self._tamano(valor)
+        if tamano > self.max_bytes:
+            return  # No cabe: no vale la pena expulsar todo lo demás
+
+        with self._lock:
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self._bytes_usados -= anterior[1]
+            self._entradas[clave] = (valor, tamano)
+            self._bytes_usados += tamano
+
+            while self._bytes_usados > self.max_bytes:
+                _, (_, tamano_viejo) = self._entradas.popitem(last=False)
+                self._bytes_usados -= tamano_viejo
+                self.expulsiones += 1
+
+    def contar_derivado(self):
+        """Registra que un resultado se calculó a partir de otro ya guardado."""
+        with self._lock:
+            self.derivados += 1
+
+    def limpiar(self):
+        """Vacía toda la caché (los contadores se conservan)."""
+        with self._lock:
+            self._entradas.clear()
+            self._bytes_usados = 0
+
+    def estadisticas(self):
+        """Devuelve un diccionario con el estado y los contadores de la caché."""
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._entradas),
+                "bytes_usados": self._bytes_usados,
+                "max_bytes": self.max_bytes,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(self.aciertos / total, 4) if total else 0.0,
+                "derivados": self.derivados,
+                "expulsiones": self.expulsiones,
+            }
+
+    @classmethod
+    def _tamano(cls, valor):
+        """Bytes (aproximados) que ocupa un valor en memoria."""
+        if isinstance(valor, np.ndarray):
+            return valor.nbytes
+        if isinstance(valor, pd.DataFrame):
+            return int(valor.memory_usage(deep=True, index=True).sum())
+        if isinstance(valor, (tuple, list)):
+            return sum(cls._tamano(v) for v in valor)
+        return sys.getsizeof(valor)
@@ -0,0 +1,394 @@
+"""
+search_index.py
+
+Índice de búsqueda por archivo para acelerar los filtros de
+"coincidencia parcial" (substring) de `filtrar_posiciones`.
+
+Para cada columna se guarda:
+- El texto en minúsculas de cada valor distinto (no de cada fila).
+- Un índice invertido de trigramas: trigrama -> valores distintos que lo contienen.
+- Los códigos que unen cada fila con su valor distinto.
+
+Una búsqueda primero reduce los candidatos con los trigramas, confirma
+el substring solo en esos valores y luego lo traslada a las filas.
+
+Para los filtros con operador (igualdad, rangos numéricos o de fechas)
+cada columna guarda además, la primera vez que se piden:
+- Un diccionario texto en minúsculas -> ids de valores distintos.
+- Cada valor distinto convertido a número y a fecha (una sola vez).
+
+Para el autocompletado (`valores_frecuentes`):
+- El conteo de filas de cada valor distinto.
+- Los textos ordenados alfabéticamente: un prefijo es un rango contiguo
+  que se encuentra con búsqueda binaria (`bisect`).
+
+Si un archivo solo agrega filas al final (actualización incremental), el
+índice de la versión nueva se arma a partir del anterior (`extendido`):
+solo se indexan los valores que no existían.
+"""
+
+import sys
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from .montos import convertir_montos
+
+TAMANO_NGRAMA = 3
+
+# Mayor que cualquier carácter: el rango de un prefijo p es [p, p + FIN_PREFIJO)
+FIN_PREFIJO = '\U0010ffff'
+
+
+def _ngramas(texto: str) -> set:
+    """Devuelve los trigramas (sin repetir) de un texto."""
+    return {texto[i:i + TAMANO_NGRAMA] for i in range(len(texto) - TAMANO_NGRAMA + 1)}
+
+
+def codigos_y_valores(serie: pd.Series):
+    """
+    Devuelve (códigos por fila, valores distintos) de una columna.
+
+    Las columnas de facturas suelen tener muchos valores repetidos (proveedor,
+    estado, moneda...). Si la columna ya es 'category' se reutilizan sus
+    códigos; si no, se factoriza.
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        codigos = serie.cat.codes.to_numpy()
+        unicos = list(serie.cat.categories)
+        if (codigos < 0).any():
+            # Valores nulos: les damos su propio código al final
+            codigos = np.where(codigos < 0, len(unicos), codigos)
+            unicos.append(np.nan)
+        return codigos, unicos
+    return pd.factorize(serie, use_na_sentinel=False)
+
+
+class IndiceColumna:
+    """Índice de búsqueda de una sola columna."""
+
+    def __init__(self, serie: pd.Series):
+        self.codigos, unicos = codigos_y_valores(serie)
+        self.unicos = unicos
+        self.textos = [str(valor).lower() for valor in unicos]
+        # Estructuras que solo algunos filtros usan: se construyen la primera vez
+        self._ngramas = None
+        self._por_texto = None
+        self._numeros = None
+        self._fechas = None
+        self._conteos = None
+        self._prefijos = None
+        self._por_frecuencia = None
+        self._medidos = {}  # Estructura -> (objeto, bytes): cada una se mide una sola vez
+
+    # Estructuras que cuentan para el tamaño del índice
+    ESTRUCTURAS = (
+        'codigos', 'unicos', 'textos', '_ngramas', '_por_texto', '_numeros', '_fechas',
+        '_conteos', '_prefijos', '_por_frecuencia'
+    )
+
+    def tamano_bytes(self) -> int:
+        """Bytes (aproximados) que ocupa el índice, contando solo las estructuras ya construidas."""
+        total = 0
+        for nombre in self.ESTRUCTURAS:
+            valor = getattr(self, nombre)
+            if valor is None:
+                continue
+            medido = self._medidos.get(nombre)
+            if medido is None or medido[0] is not valor:
+                medido = self._medidos[nombre] = (valor, _tamano(valor))
+            total += medido[1]
+        return total
+
+    @property
+    def ngramas(self) -> dict:
+        """Índice invertido trigrama -> ids de los valores distintos que lo contienen."""
+        if self._ngramas is None:
+            publicaciones = defaultdict(list)
+            for id_valor, texto in enumerate(self.textos):
+                for ngrama in _ngramas(texto):
+                    publicaciones[ngrama].append(id_valor)
+            self._ngramas = {
+                ngrama: np.asarray(ids, dtype=np.int32)
+                for ngrama, ids in publicaciones.items()
+            }
+        return self._ngramas
+
+    @property
+    def por_texto(self) -> dict:
+        """Texto en minúsculas (sin espacios a los lados) -> ids de los valores distintos con ese texto."""
+        if self._por_texto is None:
+            publicaciones = defaultdict(list)
+            for id_valor, valor in enumerate(self.unicos):
+                if not pd.isna(valor):
+                    publicaciones[self.textos[id_valor].strip()].append(id_valor)
+            self._por_texto = {
+                texto: np.asarray(ids, dtype=np.int32) for texto, ids in publicaciones.items()
+            }
+        return self._por_texto
+
+    @property
+    def numeros(self) -> np.ndarray:
+        """Cada valor distinto como float64 (los montos '$1,234.50' incluidos; NaN si no es número)."""
+        if self._numeros is None:
+            self._numeros = convertir_montos(pd.Series(self.unicos, dtype=object)).to_numpy(dtype=float)
+        return self._numeros
+
+    @property
+    def fechas(self) -> np.ndarray:
+        """Cada valor distinto como fecha (datetime64[ns]; NaT si no es fecha)."""
+        if self._fechas is None:
+            self._fechas = a_fechas(self.unicos)
+        return self._fechas
+
+    def buscar(self, valor_lower: str) -> np.ndarray:
+        """Devuelve los ids de los valores distintos que contienen `valor_lower`."""
+        if len(valor_lower) < TAMANO_NGRAMA:
+            # Muy corto para usar trigramas: revisamos los valores distintos
+            return np.asarray(
+                [i for i, texto in enumerate(self.textos) if valor_lower in texto],
+                dtype=np.int32
+            )
+
+        # Intersecta las listas de trigramas, empezando por la más corta
+        listas = []
+        for ngrama in _ngramas(valor_lower):
+            ids = self.ngramas.get(ngrama)
+            if ids is None:
+                return np.empty(0, dtype=np.int32)
+            listas.append(ids)
+        listas.sort(key=len)
+        candidatos = listas[0]
+        for ids in listas[1:]:
+            candidatos = np.intersect1d(candidatos, ids, assume_unique=True)
+            if len(candidatos) == 0:
+                return candidatos
+
+        # Los trigramas no garantizan el orden: confirmamos el substring
+        return np.asarray(
+            [i for i in candidatos if valor_lower in self.textos[i]],
+            dtype=np.int32
+        )
+
+    @property
+    def conteos(self) -> np.ndarray:
+        """Número de filas de cada valor distinto."""
+        if self._conteos is None:
+            self._conteos = np.bincount(self.codigos, minlength=len(self.textos))
+        return self._conteos
+
+    @property
+    def prefijos(self):
+        """(textos ordenados, ids en ese orden) de los valores distintos no nulos ni vacíos."""
+        if self._prefijos is None:
+            ids = np.flatnonzero(~pd.isna(np.asarray(self.unicos, dtype=object)))
+            claves = [self.textos[i].strip() for i in ids]
+            if not all(claves):
+                ids = np.asarray([i for i, clave in zip(ids, claves) if clave], dtype=np.int64)
+                claves = [clave for clave in claves if clave]
+            orden = sorted(range(len(claves)), key=claves.__getitem__)
+            self._prefijos = ([claves[i] for i in orden], ids[orden])
+        return self._prefijos
+
+    def valores_frecuentes(self, prefijo: str = '', limite: int = None):
+        """
+        Los valores distintos (no vacíos) que empiezan con `prefijo`, del más
+        al menos frecuente (a igual conteo, en orden alfabético).
+
+        Args:
+            prefijo (str): Prefijo buscado (sin distinguir mayúsculas). Vacío = todos.
+            limite (int, opcional): Máximo de valores devueltos. None = todos.
+
+        Returns:
+            tuple: (ids de los valores, conteo de cada uno, total de valores con el prefijo).
+        """
+        claves, ids = self.prefijos
+        prefijo = prefijo.strip().lower()
+        if prefijo:
+            inicio = bisect_left(claves, prefijo)
+            ids = ids[inicio:bisect_left(claves, prefijo + FIN_PREFIJO, inicio)]
+        elif limite is not None:
+            # Sin prefijo: el orden por frecuencia de toda la columna se calcula una vez
+            if self._por_frecuencia is None:
+                self._por_frecuencia = ids[np.argsort(-self.conteos[ids], kind='stable')]
+            seleccion = self._por_frecuencia[:limite]
+            return seleccion, self.conteos[seleccion], len(ids)
+
+        conteos = self.conteos[ids]
+        if limite is not None and len(ids) > limite:
+            # Solo se ordenan los `limite` más frecuentes; los empatados con el
+            # último que entra se eligen en orden alfabético
+            umbral = np.partition(conteos, len(conteos) - limite)[len(conteos) - limite]
+            mayores = np.flatnonzero(conteos > umbral)
+            iguales = np.flatnonzero(conteos == umbral)[:limite - len(mayores)]
+            seleccion = np.sort(np.concatenate([mayores, iguales]))
+            seleccion = seleccion[np.argsort(-conteos[seleccion], kind='stable')]
+        else:
+            seleccion = np.argsort(-conteos, kind='stable')
+        return ids[seleccion], conteos[seleccion], len(ids)
+
+    def extendido(self, serie: pd.Series) -> 'IndiceColumna':
+        """
+        Índice de la columna con las filas de `serie` agregadas al final.
+        Los valores ya conocidos conservan su id y los nuevos se agregan al
+        final, también a las estructuras que ya estaban construidas.
+        Este índice no cambia (lo sigue usando la versión anterior).
+        """
+        valores = serie.to_numpy(dtype=object)
+        ids = pd.Index(np.asarray(self.unicos, dtype=object)).get_indexer(valores)
+        faltan = ids < 0
+        codigos_nuevos, agregados = pd.factorize(pd.Series(valores[faltan], dtype=object), use_na_sentinel=False)
+        agregados = list(agregados)
+        base = len(self.textos)
+        ids[faltan] = base + codigos_nuevos
+
+        indice = IndiceColumna.__new__(IndiceColumna)
+        indice._medidos = {}
+        indice.codigos = np.concatenate([self.codigos.astype(np.intp, copy=False), ids])
+        indice.unicos = np.asarray(list(self.unicos) + agregados, dtype=object)
+        textos_agregados = [str(valor).lower() for valor in agregados]
+        indice.textos = self.textos + textos_agregados
+        ids_agregados = range(base, base + len(agregados))
+
+        indice._ngramas = None
+        if self._ngramas is not None:
+            publicaciones = defaultdict(list)
+            for id_valor, texto in zip(ids_agregados, textos_agregados):
+                for ngrama in _ngramas(texto):
+                    publicaciones[ngrama].append(id_valor)
+            indice._ngramas = _ampliar_publicaciones(self._ngramas, publicaciones)
+
+        indice._por_texto = None
+        if self._por_texto is not None:
+            publicaciones = defaultdict(list)
+            for id_valor, valor, texto in zip(ids_agregados, agregados, textos_agregados):
+                if not pd.isna(valor):
+                    publicaciones[texto.strip()].append(id_valor)
+            indice._por_texto = _ampliar_publicaciones(self._por_texto, publicaciones)
+
+        indice._numeros = None
+        if self._numeros is not None:
+            numeros = convertir_montos(pd.Series(agregados, dtype=object)).to_numpy(dtype=float)
+            indice._numeros = np.concatenate([self._numeros, numeros])
+
+        indice._fechas = None if self._fechas is None else np.concatenate([self._fechas, a_fechas(agregados)])
+
+        indice._conteos = None
+        if self._conteos is not None:
+            conteos = np.bincount(ids, minlength=len(indice.textos))
+            conteos[:base] += self._conteos
+            indice._conteos = conteos
+
+        indice._prefijos = None
+        if self._prefijos is not None:
+            claves, ids_claves = self._prefijos
+            nuevas = sorted(
+                (texto.strip(), id_valor) for id_valor, valor, texto in zip(ids_agregados, agregados, textos_agregados)
+                if not pd.isna(valor) and texto.strip()
+            )
+            if nuevas:
+                # A igual texto, el id menor va primero (como en `prefijos`): los nuevos van después
+                claves_nuevas = np.asarray([clave for clave, _ in nuevas], dtype=object)
+                claves = np.asarray(claves, dtype=object)
+                posiciones = np.searchsorted(claves, claves_nuevas, side='right')
+                claves = np.insert(claves, posiciones, claves_nuevas).tolist()
+                ids_claves = np.insert(ids_claves, posiciones, [id_valor for _, id_valor in nuevas])
+            indice._prefijos = (claves, ids_claves)
+        indice._por_frecuencia = None
+        return indice
+
+    def mascara_ids(self, coincide: np.ndarray) -> np.ndarray:
+        """Lleva a las filas una máscara sobre los valores distintos (una posición por valor)."""
+        return coincide[self.codigos]
+
+    def mascara(self, valores_lower: list) -> np.ndarray:
+        """Máscara booleana (una posición por fila) de las filas que contienen ALGUNO de los valores."""
+        coincide = np.zeros(len(self.textos), dtype=bool)
+        for valor_lower in valores_lower:
+            coincide[self.buscar(valor_lower)] = True
+        return coincide[self.codigos]
+
+
+def _tamano(valor) -> int:
+    """Bytes (aproximados) de una estructura del índice: arreglos, listas y diccionarios de textos e ids."""
+    if isinstance(valor, np.ndarray):
+        if valor.dtype == object:
+            return valor.nbytes + sum(sys.getsizeof(v) for v in valor)
+        return sys.getsizeof(valor)
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(sys.getsizeof(k) + _tamano(v) for k, v in valor.items())
+    if isinstance(valor, (list, tuple)):
+        return sys.getsizeof(valor) + sum(_tamano(v) for v in valor)
+    return sys.getsizeof(valor)
+
+
+def _ampliar_publicaciones(publicaciones: dict, agregadas: dict) -> dict:
+    """Copia de un índice clave -> ids con los ids de `agregadas` al final de cada lista."""
+    ampliado = dict(publicaciones)
+    for clave, ids in agregadas.items():
+        ids = np.asarray(ids, dtype=np.int32)
+        anteriores = publicaciones.get(clave)
+        ampliado[clave] = ids if anteriores is None else np.concatenate([anteriores, ids])
+    return ampliado
+
+
+def a_fechas(valores) -> np.ndarray:
+    """Convierte valores (texto o fechas de Excel) a datetime64[ns]; NaT si no son fechas."""
+    # Los números NO son fechas (pandas los tomaría como nanosegundos desde 1970)
+    valores = [None if isinstance(v, (int, float, np.number)) else v for v in valores]
+    fechas = pd.to_datetime(pd.Series(valores, dtype=object), errors='coerce', format='mixed')
+    if getattr(fechas.dt, 'tz', None) is not None:
+        fechas = fechas.dt.tz_localize(None)
+    return fechas.to_numpy(dtype='datetime64[ns]')
+
+
+class IndiceBusqueda:
+    """
+    Índice de búsqueda de un DataFrame completo.
+
+    Se crea una sola vez por archivo (justo después de la carga) y cada
+    columna se indexa la primera vez que un filtro la usa.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self._df = df
+        self._columnas = {}
+        self._lock = threading.Lock()
+
+    def columna(self, nombre) -> IndiceColumna:
+        """Devuelve (construyéndolo si hace falta) el índice de una columna."""
+        indice = self._columnas.get(nombre)
+        if indice is None:
+            with self._lock:
+                indice = self._columnas.get(nombre)
+                if indice is None:
+                    indice = IndiceColumna(self._df[nombre])  # KeyError si no existe
+                    self._columnas[nombre] = indice
+        return indice
+
+    def extendido(self, df: pd.DataFrame, nuevas: pd.DataFrame) -> 'IndiceBusqueda':
+        """
+        Índice de `df`, que son las filas de este índice más `nuevas` al
+        final. Las columnas ya indexadas se extienden con las filas nuevas;
+        las demás se indexarán cuando se pidan.
+        """
+        indice = IndiceBusqueda(df)
+        with self._lock:
+            columnas = dict(self._columnas)
+        for nombre, columna in columnas.items():
+            if nombre in nuevas.columns:
+                indice._columnas[nombre] = columna.extendido(nuevas[nombre])
+        return indice
+
+    def tamano_bytes(self) -> int:
+        """Bytes (aproximados) de las columnas indexadas hasta ahora."""
+        with self._lock:
+            columnas = list(self._columnas.values())
+        return sum(columna.tamano_bytes() for columna in columnas)
+
+    def mascara_contiene(self, nombre, valores_lower: list) -> np.ndarray:
+        """Filas de la columna `nombre` que contienen alguno de los valores (en minúsculas)."""
+        return self.columna(nombre).mascara(valores_lower)
@@ -0,0 +1,65 @@
+"""
+serializer.py
+
+Serialización rápida de DataFrames a JSON para las respuestas de la API.
+
+En vez de `to_dict(orient="records")` + `jsonify` (un dict por fila,
+codificado después por el módulo `json`), el DataFrame se escribe en
+formato columnar con un codificador nativo:
+
+    {"columns": ["Col1", "Col2"], "data": [["a", "b"], ["c", "d"]], ...}
+
+Se usa orjson si está instalado; si no, el codificador de pandas (`to_json`).
+"""
+
+import json
+
+import pandas as pd
+
+# orjson es opcional (es bastante más rápido que to_json)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FORMATO_COLUMNAR = 'columnar'
+
+def quiere_formato_columnar(args) -> bool:
+    """True si la petición pidió el formato compacto (?formato=columnar)."""
+    return args.get('formato') == FORMATO_COLUMNAR
+
+def json_columnar(df: pd.DataFrame, **extras) -> bytes:
+    """
+    Convierte el DataFrame a JSON columnar, agregando las claves de `extras`
+    (ej. num_filas, resumen) al mismo objeto.
+
+    Args:
+        df (pd.DataFrame): Las filas a enviar (el índice no se incluye).
+        **extras: Otras claves de la respuesta.
+
+    Returns:
+        bytes: El JSON completo de la respuesta (UTF-8).
+    """
+    extras = dict(extras, formato=FORMATO_COLUMNAR)
+
+    if orjson is not None:
+        # Una lista por columna (rápido) y luego se transponen a filas
+        columnas = [df.iloc[:, i].tolist() for i in range(df.shape[1])]
+        extras['columns'] = [str(col) for col in df.columns]
+        extras['data'] = list(zip(*columnas))
+        return orjson.dumps(extras, default=_a_tipo_nativo, option=orjson.OPT_SERIALIZE_NUMPY)
+
+    # '{"columns":[...],"data":[[...]]}' escrito en C por pandas
+    cuerpo = df.to_json(orient='split', index=False, force_ascii=False, double_precision=15)
+    encabezado = json.dumps(extras, ensure_ascii=False, separators=(',', ':'), default=_a_tipo_nativo)
+
+    # Unimos los dos objetos JSON: '{extras..., "columns":..., "data":...}'
+    return (encabezado[:-1] + ',' + cuerpo[1:]).encode('utf-8')
+
+def _a_tipo_nativo(valor):
+    """Convierte escalares de NumPy/pandas (int64, Timestamp...) a tipos de Python."""
+    if isinstance(valor, pd.Timestamp):
+        return valor.isoformat()
+    if hasattr(valor, 'item'):
+        return valor.item()
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
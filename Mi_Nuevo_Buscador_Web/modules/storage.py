@@ -0,0 +1,455 @@
+"""
+storage.py
+
+Almacén de los archivos subidos (temp_uploads), con deduplicación y
+expiración.
+
+- Cada archivo se guarda UNA sola vez, con el nombre del hash (sha256) de
+  su contenido: `<dataset_id>.xlsx`. Su sidecar (.arrow) y su estado de
+  ingesta comparten ese nombre, así que diez subidas del mismo archivo
+  se parsean una sola vez.
+- Cada subida recibe su propio `file_id`, que apunta a un dataset. El
+  dataset lleva la cuenta de cuántos `file_id` lo usan (referencias).
+- Un `file_id` puede tener varias PARTES (las hojas de un libro, o
+  varios archivos combinados con `combinar`); cada parte es una hoja de
+  un dataset.
+- Un hilo de barrido borra los `file_id` sin uso durante `ttl_segundos`,
+  los datasets sin referencias y, si se supera la cuota de disco, los
+  datasets usados hace más tiempo.
+
+El índice se guarda en `<carpeta>/almacen.json`. Con varios procesos
+(workers de gunicorn) cada cambio se hace con un lock de archivo. Las
+lecturas sin lock (cada petición) reutilizan el índice ya parseado mientras
+el archivo no cambie.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+# fcntl no existe en Windows; ahí se sirve con un solo proceso (waitress)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+NOMBRE_INDICE = 'almacen.json'
+TAMANO_BLOQUE = 1024 * 1024
+
+# El último acceso de un file_id se escribe en disco como mucho una vez por intervalo
+INTERVALO_ACCESO = 60
+
+
+class AlmacenArchivos:
+    """
+    Archivos subidos, deduplicados por contenido y con política de retención.
+
+    Args:
+        carpeta (str): Carpeta de los archivos (ej. 'temp_uploads').
+        ttl_segundos (int): Tiempo sin uso tras el cual un file_id expira.
+        cuota_bytes (int): Espacio máximo que pueden ocupar los datasets.
+        al_borrar (callable, opcional): Se llama con el `dataset_id` de cada
+            dataset borrado (ej. para descartarlo de la caché).
+    """
+
+    def __init__(self, carpeta, ttl_segundos=24 * 60 * 60, cuota_bytes=2 * 1024 ** 3, al_borrar=None):
+        self.carpeta = carpeta
+        self.ttl_segundos = ttl_segundos
+        self.cuota_bytes = cuota_bytes
+        self.al_borrar = al_borrar
+        self._ruta_indice = os.path.join(carpeta, NOMBRE_INDICE)
+        self._ruta_lock = os.path.join(carpeta, NOMBRE_INDICE + '.lock')
+        self._lock = threading.Lock()
+        self._hilo_barrido = None
+        self._indice_leido = None  # (firma del archivo, índice parseado)
+
+        # Contadores (de este proceso)
+        self.subidas = 0
+        self.deduplicadas = 0
+        self.expirados = 0
+        self.borrados_por_cuota = 0
+
+    # --- API pública ---
+
+    def guardar(self, origen):
+        """
+        Guarda un archivo subido, calculando su hash mientras se escribe.
+
+        Args:
+            origen: Objeto con `.read(n)` (ej. `request.files['file'].stream`).
+
+        Returns:
+            tuple: (file_id, dataset_id, nuevo). `nuevo` es False si el mismo
+                   contenido ya estaba guardado (no hace falta volver a parsearlo).
+        """
+        ruta_temporal = os.path.join(self.carpeta, f".subida-{uuid.uuid4().hex}.tmp")
+        hash_contenido = hashlib.sha256()
+        with open(ruta_temporal, 'wb') as destino:
+            while True:
+                bloque = origen.read(TAMANO_BLOQUE)
+                if not bloque:
+                    break
+                hash_contenido.update(bloque)
+                destino.write(bloque)
+
+        dataset_id = hash_contenido.hexdigest()
+        file_id = str(uuid.uuid4())
+        ahora = time.time()
+        with self._indice_bloqueado() as indice:
+            dataset = indice['datasets'].get(dataset_id)
+            nuevo = dataset is None or not os.path.exists(self.ruta(dataset_id))
+            if nuevo:
+                os.replace(ruta_temporal, self.ruta(dataset_id))
+                dataset = {'creado': ahora, 'referencias': 0, 'bytes': os.path.getsize(self.ruta(dataset_id))}
+                indice['datasets'][dataset_id] = dataset
+            else:
+                os.remove(ruta_temporal)
+            dataset['referencias'] += 1
+            dataset['ultimo_acceso'] = ahora
+            indice['archivos'][file_id] = {'dataset': dataset_id, 'creado': ahora, 'ultimo_acceso': ahora}
+
+        self.subidas += 1
+        if not nuevo:
+            self.deduplicadas += 1
+        return file_id, dataset_id, nuevo
+
+    def registrar_partes(self, file_id, partes):
+        """
+        Guarda las partes (hojas) de un `file_id` recién subido.
+
+        Args:
+            file_id (str): El file_id devuelto por `guardar`.
+            partes (list): Diccionarios {'hoja', 'nombre', 'columnas'}.
+        """
+        with self._indice_bloqueado() as indice:
+            archivo = indice['archivos'].get(file_id)
+            if archivo is not None:
+                archivo['partes'] = [dict(parte, dataset=archivo['dataset']) for parte in partes]
+
+    def combinar(self, file_ids):
+        """
+        Crea un `file_id` nuevo con todas las partes de varios file_id
+        (ej. los archivos de cada mes), sin copiar ningún archivo.
+
+        Returns:
+            str | None: El file_id nuevo, o None si alguno no existe o expiró.
+        """
+        ahora = time.time()
+        with self._indice_bloqueado() as indice:
+            partes = []
+            for file_id in file_ids:
+                archivo = indice['archivos'].get(file_id)
+                if archivo is None:
+                    return None
+                partes += [dict(parte) for parte in _partes_de(archivo)]
+
+            # Nombres únicos: cada mes suele llamarse igual ('Sheet1')
+            usados = {}
+            for parte in partes:
+                nombre = parte.get('nombre') or parte['dataset'][:8]
+                usados[nombre] = usados.get(nombre, 0) + 1
+                parte['nombre'] = nombre if usados[nombre] == 1 else f"{nombre} ({usados[nombre]})"
+
+            nuevo_id = str(uuid.uuid4())
+            for dataset_id in {parte['dataset'] for parte in partes}:
+                indice['datasets'][dataset_id]['referencias'] += 1
+            indice['archivos'][nuevo_id] = {
+                'dataset': partes[0]['dataset'], 'partes': partes, 'creado': ahora, 'ultimo_acceso': ahora
+            }
+        return nuevo_id
+
+    def resolver(self, file_id):
+        """
+        Devuelve (dataset_id, ruta del .xlsx) de la primera parte de un
+        `file_id` y registra el acceso.
+
+        Returns:
+            tuple: (dataset_id, ruta), o (None, None) si el file_id no existe
+                   o ya expiró.
+        """
+        partes = self.resolver_partes(file_id)
+        if not partes:
+            return None, None
+        return partes[0]['dataset'], partes[0]['ruta']
+
+    def resolver_partes(self, file_id):
+        """
+        Devuelve las partes de un `file_id` y registra el acceso.
+
+        Returns:
+            list | None: Un diccionario por parte: {'dataset', 'ruta', 'hoja',
+                'nombre', 'columnas'} ('nombre' y 'columnas' pueden faltar en
+                archivos antiguos). None si el file_id no existe o ya expiró.
+        """
+        if not file_id:
+            return None
+        indice = self._leer_indice()
+        archivo = indice['archivos'].get(file_id)
+        if archivo is None:
+            dataset_id, ruta = self._adoptar_antiguo(file_id)
+            return [{'dataset': dataset_id, 'ruta': ruta, 'hoja': 0}] if ruta else None
+
+        partes = [dict(parte, ruta=self.ruta(parte['dataset'])) for parte in _partes_de(archivo)]
+        if not all(os.path.exists(parte['ruta']) for parte in partes):
+            return None
+
+        ahora = time.time()
+        if ahora - archivo['ultimo_acceso'] > INTERVALO_ACCESO:
+            with self._indice_bloqueado() as indice:
+                entradas = [indice['archivos'].get(file_id)]
+                entradas += [indice['datasets'].get(parte['dataset']) for parte in partes]
+                for entrada in entradas:
+                    if entrada is not None:
+                        entrada['ultimo_acceso'] = ahora
+        return partes
+
+    def liberar(self, file_id):
+        """Quita un `file_id` (ej. si el archivo subido no es un Excel válido)."""
+        with self._indice_bloqueado() as indice:
+            borrados = self._quitar_archivo(indice, file_id)
+        self._avisar_borrados(borrados)
+
+    def ruta(self, dataset_id):
+        """Ruta del .xlsx de un dataset."""
+        return os.path.join(self.carpeta, f"{dataset_id}.xlsx")
+
+    def barrer(self):
+        """
+        Aplica la política de retención:
+        1. Expira los file_id sin uso durante más de `ttl_segundos`.
+        2. Borra los datasets que se quedaron sin referencias.
+        3. Si los datasets ocupan más que `cuota_bytes`, borra los usados
+           hace más tiempo (siempre se conserva el más reciente).
+
+        Returns:
+            list: Los `dataset_id` borrados.
+        """
+        ahora = time.time()
+        borrados = []
+        with self._indice_bloqueado() as indice:
+            vencidos = [
+                file_id for file_id, archivo in indice['archivos'].items()
+                if ahora - archivo['ultimo_acceso'] > self.ttl_segundos
+            ]
+            for file_id in vencidos:
+                borrados += self._quitar_archivo(indice, file_id)
+            self.expirados += len(vencidos)
+
+            # El tamaño real incluye el sidecar y el estado de la ingesta
+            for dataset_id, dataset in indice['datasets'].items():
+                dataset['bytes'] = self._bytes_en_disco(dataset_id)
+
+            tamanos = {dataset_id: dataset['bytes'] for dataset_id, dataset in indice['datasets'].items()}
+            total = sum(tamanos.values())
+            por_antiguedad = sorted(indice['datasets'], key=lambda d: indice['datasets'][d]['ultimo_acceso'])
+            for dataset_id in por_antiguedad[:-1]:
+                if total <= self.cuota_bytes:
+                    break
+                if dataset_id not in indice['datasets']:
+                    continue  # Ya cayó junto con otro (un file_id combinado)
+                for borrado in self._borrar_dataset(indice, dataset_id):
+                    total -= tamanos.get(borrado, 0)
+                    borrados.append(borrado)
+                self.borrados_por_cuota += 1
+
+        self._avisar_borrados(borrados)
+        return borrados
+
+    def iniciar_barrido(self, intervalo_segundos=300):
+        """Arranca (una vez por proceso) el hilo que llama a `barrer` periódicamente."""
+        if self._hilo_barrido is not None:
+            return
+
+        def bucle():
+            while True:
+                time.sleep(intervalo_segundos)
+                try:
+                    self.barrer()
+                except Exception as e:
+                    print(f"Error en el barrido de {self.carpeta}: {e}")
+
+        self._hilo_barrido = threading.Thread(target=bucle, name='barrido-uploads', daemon=True)
+        self._hilo_barrido.start()
+
+    def estadisticas(self):
+        """Devuelve un diccionario con el estado del almacén."""
+        indice = self._leer_indice()
+        return {
+            "archivos": len(indice['archivos']),
+            "datasets": len(indice['datasets']),
+            "bytes_usados": sum(dataset['bytes'] for dataset in indice['datasets'].values()),
+            "cuota_bytes": self.cuota_bytes,
+            "ttl_segundos": self.ttl_segundos,
+            "subidas": self.subidas,
+            "deduplicadas": self.deduplicadas,
+            "expirados": self.expirados,
+            "borrados_por_cuota": self.borrados_por_cuota,
+        }
+
+    # --- Funciones internas ---
+
+    def _quitar_archivo(self, indice, file_id):
+        """
+        Quita un file_id; los datasets que se quedan sin referencias se borran.
+
+        Returns:
+            list: Los `dataset_id` borrados.
+        """
+        archivo = indice['archivos'].pop(file_id, None)
+        if archivo is None:
+            return []
+        borrados = []
+        for dataset_id in {parte['dataset'] for parte in _partes_de(archivo)}:
+            dataset = indice['datasets'].get(dataset_id)
+            if dataset is None:
+                continue
+            dataset['referencias'] -= 1
+            if dataset['referencias'] <= 0:
+                borrados += self._borrar_dataset(indice, dataset_id)
+        return borrados
+
+    def _borrar_dataset(self, indice, dataset_id):
+        """
+        Borra del disco el dataset (xlsx, sidecars, estado) y todos los file_id
+        que lo usan (lo que a su vez puede dejar otros datasets sin referencias).
+
+        Returns:
+            list: Los `dataset_id` borrados (este y los que caigan con él).
+        """
+        indice['datasets'].pop(dataset_id, None)
+        for ruta in glob.glob(os.path.join(self.carpeta, glob.escape(dataset_id) + '.*')):
+            try:
+                os.remove(ruta)
+            except OSError as e:
+                print(f"Advertencia: no se pudo borrar {ruta}: {e}")
+
+        borrados = [dataset_id]
+        usuarios = [
+            file_id for file_id, archivo in indice['archivos'].items()
+            if any(parte['dataset'] == dataset_id for parte in _partes_de(archivo))
+        ]
+        for file_id in usuarios:
+            borrados += self._quitar_archivo(indice, file_id)
+        return borrados
+
+    def _avisar_borrados(self, borrados):
+        if self.al_borrar is not None:
+            for dataset_id in borrados:
+                self.al_borrar(dataset_id)
+
+    def _bytes_en_disco(self, dataset_id):
+        total = 0
+        for ruta in glob.glob(os.path.join(self.carpeta, glob.escape(dataset_id) + '.*')):
+            try:
+                total += os.path.getsize(ruta)
+            except OSError:
+                pass  # Se borró mientras tanto
+        return total
+
+    def _adoptar_antiguo(self, file_id):
+        """
+        Archivos subidos antes del almacén (`<uuid>.xlsx`): se registran como
+        un dataset propio para que también los cubra la retención.
+
+        Solo se adoptan ids con forma de uuid que no sean ya un dataset: un
+        `dataset_id` (sha256) usado como file_id no debe pisar su entrada.
+        """
+        if not _es_uuid(file_id):
+            return None, None
+        ruta = self.ruta(file_id)
+        if not os.path.exists(ruta):
+            return None, None
+        ahora = time.time()
+        with self._indice_bloqueado() as indice:
+            if file_id not in indice['archivos']:
+                if file_id in indice['datasets']:
+                    return None, None
+                indice['datasets'][file_id] = {
+                    'creado': ahora, 'ultimo_acceso': ahora, 'referencias': 1, 'bytes': os.path.getsize(ruta)
+                }
+                indice['archivos'][file_id] = {'dataset': file_id, 'creado': ahora, 'ultimo_acceso': ahora}
+        return file_id, ruta
+
+    def _leer_indice(self, compartido=True):
+        """
+        El índice tal como está en disco.
+
+        Args:
+            compartido (bool): Si es True se reutiliza el último índice parseado
+                mientras el archivo no cambie (mismo inodo, fecha y tamaño; cada
+                escritura lo reemplaza). Ese diccionario es compartido y no
+                debe modificarse: los cambios van por `_indice_bloqueado`,
+                que lee una copia propia (compartido=False).
+        """
+        try:
+            with open(self._ruta_indice, encoding='utf-8') as archivo:
+                estado = os.fstat(archivo.fileno())
+                firma = (estado.st_ino, estado.st_mtime_ns, estado.st_size)
+                leido = self._indice_leido
+                if compartido and leido is not None and leido[0] == firma:
+                    return leido[1]
+                indice = json.load(archivo)
+            if compartido:
+                self._indice_leido = (firma, indice)
+            return indice
+        except FileNotFoundError:
+            return {'archivos': {}, 'datasets': {}}
+        except ValueError as e:
+            print(f"Advertencia: índice de {self.carpeta} dañado, se empieza de cero: {e}")
+            return {'archivos': {}, 'datasets': {}}
+
+    def _escribir_indice(self, indice):
+        ruta_temporal = f"{self._ruta_indice}.{os.getpid()}.tmp"
+        with open(ruta_temporal, 'w', encoding='utf-8') as archivo:
+            json.dump(indice, archivo)
+        os.replace(ruta_temporal, self._ruta_indice)  # Atómico: nadie lee un índice a medias
+
+    def _indice_bloqueado(self):
+        return _IndiceBloqueado(self)
+
+
+def _es_uuid(texto):
+    """Si `texto` es un uuid en su forma de texto habitual (ej. los file_id antiguos)."""
+    try:
+        return str(uuid.UUID(texto)) == texto
+    except (AttributeError, TypeError, ValueError):
+        return False
+
+
+def _partes_de(archivo):
+    """Partes de una entrada del índice (las entradas sin 'partes' son la primera hoja de su dataset)."""
+    return archivo.get('partes') or [{'dataset': archivo['dataset'], 'hoja': 0}]
+
+
+class _IndiceBloqueado:
+    """
+    Context manager: lee el índice con el lock tomado (entre hilos y, si
+    hay fcntl, entre procesos) y lo vuelve a escribir al salir.
+    """
+
+    def __init__(self, almacen):
+        self._almacen = almacen
+        self._archivo_lock = None
+
+    def __enter__(self):
+        self._almacen._lock.acquire()
+        if fcntl is not None:
+            self._archivo_lock = open(self._almacen._ruta_lock, 'a')
+            fcntl.flock(self._archivo_lock, fcntl.LOCK_EX)
+        self._indice = self._almacen._leer_indice(compartido=False)
+        return self._indice
+
+    def __exit__(self, tipo_error, error, traza):
+        try:
+            if tipo_error is None:
+                self._almacen._escribir_indice(self._indice)
+        finally:
+            if self._archivo_lock is not None:
+                fcntl.flock(self._archivo_lock, fcntl.LOCK_UN)
+                self._archivo_lock.close()
+            self._almacen._lock.release()
+        return False
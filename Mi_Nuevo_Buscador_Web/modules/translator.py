@@ -43,7 +43,22 @@ LANGUAGES = {
         "group_avg_amount": "Monto Promedio",
         "group_min_amount": "Monto Mínimo",
         "group_max_amount": "Monto Máximo",
-        "group_invoice_count": "Conteo de Facturas"
+        "group_invoice_count": "Conteo de Facturas",
+        "upload_processing": "Procesando",
+        "upload_rows": "filas",
+        "upload_all_sheets": "Cargar todas las hojas",
+        "upload_update_dataset": "Actualizar el archivo actual (filas agregadas)",
+        "upload_new_rows": "filas nuevas",
+        "op_contains": "contiene",
+        "op_eq": "es igual a",
+        "op_in": "es uno de (a, b, ...)",
+        "op_prefix": "empieza con",
+        "op_gt": "mayor que",
+        "op_lt": "menor que",
+        "op_between": "entre (mín..máx)",
+        "op_date_from": "desde la fecha",
+        "op_date_to": "hasta la fecha",
+        "op_date_between": "entre fechas (desde..hasta)"
     },
     "en": {
         "title": "Dynamic Invoice Search",
@@ -86,7 +101,22 @@ LANGUAGES = {
         "group_avg_amount": "Average Amount",
         "group_min_amount": "Minimum Amount",
         "group_max_amount": "Maximum Amount",
-        "group_invoice_count": "Invoice Count"
+        "group_invoice_count": "Invoice Count",
+        "upload_processing": "Processing",
+        "upload_rows": "rows",
+        "upload_all_sheets": "Load all sheets",
+        "upload_update_dataset": "Update the current file (appended rows)",
+        "upload_new_rows": "new rows",
+        "op_contains": "contains",
+        "op_eq": "equals",
+        "op_in": "is one of (a, b, ...)",
+        "op_prefix": "starts with",
+        "op_gt": "greater than",
+        "op_lt": "less than",
+        "op_between": "between (min..max)",
+        "op_date_from": "from date",
+        "op_date_to": "to date",
+        "op_date_between": "between dates (from..to)"
     }
 }
 
@@ -0,0 +1,75 @@
+"""
+serve.py
+
+Punto de entrada de producción del buscador.
+
+- Con gunicorn (Linux/macOS): varios procesos, configurados en gunicorn.conf.py.
+- Sin gunicorn (ej. Windows): waitress, un solo proceso con varios hilos.
+
+Uso (desde la carpeta Mi_Nuevo_Buscador_Web):
+    python serve.py --workers 4 --bind 0.0.0.0:8000
+
+`app.py` sigue sirviendo para desarrollo (servidor de Flask con debug).
+"""
+
+import argparse
+import os
+import sys
+
+CARPETA = os.path.dirname(os.path.abspath(__file__))
+CONFIG_GUNICORN = os.path.join(CARPETA, 'gunicorn.conf.py')
+
+
+def servir_gunicorn(bind, workers, threads):
+    """Arranca gunicorn con gunicorn.conf.py (los argumentos tienen prioridad)."""
+    from gunicorn.app.wsgiapp import WSGIApplication
+
+    argv = ['gunicorn', '-c', CONFIG_GUNICORN]
+    if bind:
+        argv += ['--bind', bind]
+    if workers:
+        argv += ['--workers', str(workers)]
+    if threads:
+        argv += ['--threads', str(threads)]
+    sys.argv = argv + ['app:app']
+    WSGIApplication("%(prog)s [OPTIONS] [APP_MODULE]").run()
+
+
+def servir_waitress(bind, threads):
+    """Arranca waitress (un proceso). Los hilos comparten la caché, pero no el GIL."""
+    from waitress import serve
+    from app import app
+
+    print("Aviso: gunicorn no está disponible; se usa waitress con un solo proceso.")
+    host, _, puerto = (bind or '0.0.0.0:8000').rpartition(':')
+    serve(app, host=host or '0.0.0.0', port=int(puerto), threads=threads or 8)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de producción del buscador de facturas")
+    parser.add_argument('--bind', help="host:puerto (por defecto, el de gunicorn.conf.py: 0.0.0.0:8000)")
+    parser.add_argument('--workers', type=int, help="Procesos (por defecto, uno por núcleo)")
+    parser.add_argument('--threads', type=int, help="Hilos por proceso")
+    parser.add_argument('--servidor', choices=['auto', 'gunicorn', 'waitress'], default='auto')
+    args = parser.parse_args()
+
+    # Las rutas relativas (temp_uploads) deben ser las mismas para todos los workers
+    os.chdir(CARPETA)
+    sys.path.insert(0, CARPETA)
+
+    servidor = args.servidor
+    if servidor == 'auto':
+        try:
+            import gunicorn  # noqa: F401
+            servidor = 'gunicorn'
+        except ImportError:
+            servidor = 'waitress'
+
+    if servidor == 'gunicorn':
+        servir_gunicorn(args.bind, args.workers, args.threads)
+    else:
+        servir_waitress(args.bind, args.threads)
+
+
+if __name__ == '__main__':
+    main()
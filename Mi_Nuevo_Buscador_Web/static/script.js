@@ -6,16 +6,34 @@ let i18n = {};
 // --- Variables de Estado Globales ---
 let currentFileId = null; 
 let activeFilters = []; 
-let currentData = [];
-let tableData = [];
+let currentData = [];      // Filas ya descargadas (páginas del servidor)
+let totalRows = 0;         // Total de filas que cumplen los filtros
 let todasLasColumnas = [];
 let columnasVisibles = [];
 let sortState = { column: null, direction: 'asc' };
 let currentView = 'detailed'; // 'detailed' o 'grouped'
 
+// --- Paginación del lado del servidor ---
+const PAGE_SIZE = 200;
+let isLoadingPage = false;
+let filterRequestSeq = 0;  // Para descartar respuestas viejas
+let pageObserver = null;
+let searchDebounceTimer = null;
+
+// --- Autocompletado del valor de un filtro (/api/column_values) ---
+const SUGERENCIAS_LIMITE = 20;
+let suggestDebounceTimer = null;
+let suggestRequestSeq = 0;
+
+// --- Ingesta en segundo plano (progreso del upload) ---
+const INGESTA_POLL_MS = 500;
+
+// Las APIs de datos se piden en formato columnar ({columns, data: [[...]]}), más liviano
+const FORMATO_COLUMNAR = '?formato=columnar';
+
 const COLUMNAS_AGRUPABLES = [
     "Vendor Name", "Status", "Assignee", 
-    "Operating Unit Name", "Pay Status", "Document Type", "_row_status"
+    "Operating Unit Name", "Pay Status", "Document Type", "_row_status", "_hoja"
 ];
 
 // --- Función de inicialización ---
@@ -63,7 +81,13 @@ function updateVisibleColumnsFromCheckboxes() {
             columnasVisibles.push(cb.value);
         }
     });
-    renderTable();
+    // La búsqueda rápida usa las columnas visibles: si hay texto, se vuelve a pedir
+    const searchTableInput = document.getElementById('input-search-table');
+    if (searchTableInput && searchTableInput.value && currentView === 'detailed') {
+        getFilteredData();
+    } else {
+        renderTable();
+    }
 }
 
 function handleColumnVisibilityChange(event) {
@@ -121,6 +145,8 @@ function setupEventListeners() {
     // --- Listeners Generales ---
     addSafeListener(fileUploader, 'change', handleFileUpload);
     addSafeListener(btnAdd, 'click', handleAddFilter);
+    addSafeListener(document.getElementById('select-columna'), 'change', handleSuggestValues);
+    addSafeListener(document.getElementById('input-valor'), 'input', handleSuggestValues);
     addSafeListener(btnLangEs, 'click', () => setLanguage('es'));
     addSafeListener(btnLangEn, 'click', () => setLanguage('en'));
     addSafeListener(columnSelectorWrapper, 'change', handleColumnVisibilityChange);
@@ -211,6 +237,11 @@ async function handleFileUpload(event) {
     `;     
 
     const formData = new FormData(); formData.append('file', file);
+    const checkTodasHojas = document.getElementById('check-todas-hojas');
+    formData.append('hojas', (checkTodasHojas && checkTodasHojas.checked) ? 'todas' : 'primera');
+    // Versión nueva del archivo actual: el servidor solo procesa las filas agregadas
+    const checkActualizar = document.getElementById('check-actualizar');
+    if (checkActualizar && checkActualizar.checked && currentFileId) formData.append('actualizar', currentFileId);
     try {
         const response = await fetch('/api/upload', { method: 'POST', body: formData });
         const result = await response.json(); if (!response.ok) throw new Error(result.error);
@@ -235,6 +266,15 @@ async function handleFileUpload(event) {
         document.getElementById('input-search-table').value = ''; 
         sortState = { column: null, direction: 'asc' };
 
+        // Las columnas ya se pueden usar; las filas se siguen procesando en el servidor
+        const fileSizeSpan = fileUploadList.querySelector('.file-size');
+        const status = await waitForIngestion(result.file_id, fileSizeSpan);
+        if (!status) return; // Se subió otro archivo mientras tanto
+        fileSizeSpan.textContent = `${fileSizeMB}MB · ${status.filas_leidas.toLocaleString()} ${i18n['upload_rows'] || 'rows'}`;
+        if (status.detalle && status.detalle.actualizacion === 'incremental') {
+            fileSizeSpan.textContent += ` (+${status.detalle.filas_nuevas.toLocaleString()} ${i18n['upload_new_rows'] || 'new rows'})`;
+        }
+
         // Asegura que la vista detallada sea la activa al cargar
         toggleView('detailed', true); // true = forzar reseteo
 
@@ -248,14 +288,32 @@ async function handleFileUpload(event) {
     }
 }
 
+// Consulta el progreso de la ingesta hasta que el servidor termine de procesar el archivo.
+// Devuelve el estado final, o null si mientras tanto se cargó otro archivo.
+async function waitForIngestion(fileId, progressSpan) {
+    while (currentFileId === fileId) {
+        const response = await fetch(`/api/upload_status/${fileId}`);
+        const status = await response.json(); if (!response.ok) throw new Error(status.error);
+        if (status.estado === 'listo') return status;
+        if (status.estado === 'error') throw new Error(status.error);
+
+        const porcentaje = status.bytes_totales ? Math.round(100 * status.bytes_leidos / status.bytes_totales) : 0;
+        progressSpan.textContent = `${i18n['upload_processing'] || 'Processing'}: ${porcentaje}% · ${status.filas_leidas.toLocaleString()} ${i18n['upload_rows'] || 'rows'}`;
+        await new Promise(resolve => setTimeout(resolve, INGESTA_POLL_MS));
+    }
+    return null;
+}
+
 async function handleAddFilter() {
     const colSelect = document.getElementById('select-columna');
     const valInput = document.getElementById('input-valor');
+    const opSelect = document.getElementById('select-operador');
     const col = colSelect.value; 
     const val = valInput.value;
+    const op = opSelect ? opSelect.value : 'contains';
     
     if (col && val) { 
-        activeFilters.push({ columna: col, valor: val }); 
+        activeFilters.push({ columna: col, valor: val, op: op }); 
         valInput.value = ''; 
         if (currentView === 'detailed') {
             document.getElementById('input-search-table').value = ''; 
@@ -311,26 +369,56 @@ function handleFullscreen(event) {
     }
 }
 
-function handleSearchTable() {
-    const searchTableInput = document.getElementById('input-search-table');
-    const searchTerm = searchTableInput.value.toLowerCase();
-    
-    if (!searchTerm) { 
-        tableData = [...currentData];
-    }
-    else { 
-        tableData = currentData.filter(row => 
-            columnasVisibles.some(col => 
-                String(row[col]).toLowerCase().includes(searchTerm)
-            )
-        ); 
-    }
-    applySort();
-    if (currentView === 'detailed') {
-        renderTable();
+function handleSuggestValues() {
+    // Sugerencias de valores de la columna elegida; esperamos a que el usuario deje de escribir
+    clearTimeout(suggestDebounceTimer);
+    suggestDebounceTimer = setTimeout(loadSuggestedValues, 150);
+}
+
+async function loadSuggestedValues() {
+    const datalist = document.getElementById('lista-valores');
+    const col = document.getElementById('select-columna').value;
+    if (!datalist) return;
+    if (!currentFileId || !col) { datalist.innerHTML = ''; return; }
+
+    const seq = ++suggestRequestSeq;
+    try {
+        const response = await fetch('/api/column_values', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                file_id: currentFileId,
+                columna: col,
+                prefijo: document.getElementById('input-valor').value,
+                limite: SUGERENCIAS_LIMITE
+            })
+        });
+        const result = await response.json();
+        if (seq !== suggestRequestSeq) return; // Llegó una respuesta más nueva
+        if (!response.ok) throw new Error(result.error);
+
+        datalist.innerHTML = '';
+        result.valores.forEach(({ valor, conteo }) => {
+            const option = document.createElement('option');
+            option.value = valor;
+            option.label = `${valor} (${conteo.toLocaleString()})`;
+            datalist.appendChild(option);
+        });
+    } catch (error) {
+        console.warn('Error al cargar sugerencias:', error);
     }
 }
 
+function handleSearchTable() {
+    // La búsqueda se hace en el servidor; esperamos a que el usuario deje de escribir
+    clearTimeout(searchDebounceTimer);
+    searchDebounceTimer = setTimeout(() => {
+        if (currentView === 'detailed') {
+            getFilteredData();
+        }
+    }, 300);
+}
+
 async function handleDownloadExcel() {
     if (currentData.length === 0 || !currentFileId) { 
         alert(i18n['no_data_to_download'] || "No hay datos para descargar."); 
@@ -421,8 +509,8 @@ function handleSort(event) {
         sortState.column = columnToSort; 
         sortState.direction = 'asc'; 
     }
-    applySort(); 
-    renderTable();
+    // El orden se aplica en el servidor (el monto se ordena como número)
+    getFilteredData();
 }
 
 // ---
@@ -439,27 +527,6 @@ function resetResumenCard() {
     if (montoPromedio) montoPromedio.textContent = '$0.00';
 }
 
-function applySort() {
-    if (!sortState.column) return;
-    const column = sortState.column; 
-    const direction = sortState.direction === 'asc' ? 1 : -1;
-    tableData.sort((a, b) => {
-        const valA = a[column]; 
-        const valB = b[column];
-        const numA = parseFloat(valA); 
-        const numB = parseFloat(valB);
-        if (!isNaN(numA) && !isNaN(numB)) { 
-            return (numA - numB) * direction; 
-        } else { 
-            const strA = String(valA).toLowerCase(); 
-            const strB = String(valB).toLowerCase(); 
-            if (strA < strB) return -1 * direction; 
-            if (strA > strB) return 1 * direction; 
-            return 0; 
-        }
-    });
-}
-
 // (ARREGLO 3) renderFilters actualizado
 function renderFilters() {
     const listId = (currentView === 'detailed') ? 'active-filters-list' : 'active-filters-list-grouped';
@@ -486,7 +553,7 @@ function renderFilters() {
     activeFilters.forEach((filtro, index) => {
         const filterItemHTML = `
             <div class="filtro-chip">
-                <span>${filtro.columna}: <strong>${filtro.valor}</strong></span>
+                <span>${filtro.columna}${(filtro.op && filtro.op !== 'contains') ? ' ' + (i18n['op_' + filtro.op] || filtro.op) : ''}: <strong>${filtro.valor}</strong></span>
                 <button class="remove-filter-btn" data-index="${index}">&times;</button>
             </div>
         `;
@@ -503,7 +570,7 @@ function renderTable(data = null, forceClear = false) {
         return;
     }
     
-    const dataToRender = data || tableData;
+    const dataToRender = data || currentData;
     resultsTableDiv.innerHTML = ''; 
     
     if (!currentFileId) { 
@@ -544,19 +611,46 @@ function renderTable(data = null, forceClear = false) {
     });
 
     const tbody = table.createTBody();
-    dataToRender.forEach((fila, index) => {
-        const row = tbody.insertRow();
+    appendTableRows(tbody, dataToRender, 0);
+    
+    resultsTableDiv.appendChild(table);
+    observeLastRow(tbody);
+}
+
+/**
+ * Agrega filas al cuerpo de la tabla (usado al dibujar y al recibir más páginas).
+ */
+function appendTableRows(tbody, rows, startIndex) {
+    const fragment = document.createDocumentFragment();
+    rows.forEach((fila, index) => {
+        const row = document.createElement('tr');
         const tdNum = row.insertCell();
         tdNum.className = 'cell-row-number';
-        tdNum.textContent = index + 1;
+        tdNum.textContent = startIndex + index + 1;
         
         columnasVisibles.forEach(colName => {
             const cell = row.insertCell(); 
             cell.textContent = fila.hasOwnProperty(colName) ? fila[colName] : ''; 
         });
+        fragment.appendChild(row);
     });
-    
-    resultsTableDiv.appendChild(table);
+    tbody.appendChild(fragment);
+}
+
+/**
+ * Scroll infinito: cuando la última fila se vuelve visible, pide la siguiente página.
+ */
+function observeLastRow(tbody) {
+    if (pageObserver) pageObserver.disconnect();
+    if (!tbody || currentData.length >= totalRows || !('IntersectionObserver' in window)) return;
+
+    pageObserver = new IntersectionObserver((entries) => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            loadNextPage();
+        }
+    });
+    const lastRow = tbody.rows[tbody.rows.length - 1];
+    if (lastRow) pageObserver.observe(lastRow);
 }
 
 // ---
@@ -570,42 +664,95 @@ async function refreshActiveView() {
     } 
     else if (currentView === 'grouped') {
         renderTable(null, true); // true = forzar limpieza
-        await getGroupedData();
+        await Promise.all([getGroupedData(), refreshResumenCard()]);
     }
 }
 
+function renderResumenCard(resumen) {
+    const totalFacturas = document.getElementById('resumen-total-facturas');
+    const montoTotal = document.getElementById('resumen-monto-total');
+    const montoPromedio = document.getElementById('resumen-monto-promedio');
+    if (totalFacturas) totalFacturas.textContent = resumen.total_facturas;
+    if (montoTotal) montoTotal.textContent = resumen.monto_total;
+    if (montoPromedio) montoPromedio.textContent = resumen.monto_promedio;
+}
+
+/**
+ * Actualiza solo la tarjeta de resumen (summary_only: el servidor no ordena ni envía filas).
+ */
+async function refreshResumenCard() {
+    if (!currentFileId) { resetResumenCard(); return; }
+    try {
+        const response = await fetch('/api/filter', {
+            method: 'POST', headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ file_id: currentFileId, filtros_activos: activeFilters, summary_only: true })
+        });
+        const result = await response.json();
+        if (!response.ok) throw new Error(result.error);
+        renderResumenCard(result.resumen);
+    } catch (error) {
+        console.error('Error al actualizar el resumen:', error);
+        resetResumenCard();
+    }
+}
+
+/**
+ * Convierte una respuesta columnar ({columns, data: [[...]]}) en una lista de objetos.
+ * Si la respuesta ya viene como lista de objetos, la devuelve tal cual.
+ */
+function rowsFromResponse(result) {
+    if (!result.columns) return result.data;
+    const columns = result.columns;
+    return result.data.map(values => {
+        const row = {};
+        columns.forEach((col, i) => { row[col] = values[i]; });
+        return row;
+    });
+}
+
+/**
+ * Cuerpo de la petición a /api/filter para una página que empieza en `offset`.
+ */
+function buildFilterRequest(offset) {
+    const searchTableInput = document.getElementById('input-search-table');
+    return {
+        file_id: currentFileId,
+        filtros_activos: activeFilters,
+        offset: offset,
+        limit: PAGE_SIZE,
+        sort_column: sortState.column,
+        sort_direction: sortState.direction,
+        busqueda: searchTableInput ? searchTableInput.value : '',
+        columnas_busqueda: columnasVisibles
+    };
+}
+
 async function getFilteredData() {
     const resultsHeader = document.getElementById('results-header');
     if (!currentFileId) { 
         currentData = []; 
-        tableData = []; 
+        totalRows = 0; 
         renderFilters(); 
         renderTable();
         resetResumenCard(); 
         if (resultsHeader) resultsHeader.textContent = i18n['results_header']?.split('(')[0] || 'Results'; 
         return; 
     }
+    const requestSeq = ++filterRequestSeq;
     try {
-        const response = await fetch('/api/filter', {
+        const response = await fetch('/api/filter' + FORMATO_COLUMNAR, {
             method: 'POST', headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ file_id: currentFileId, filtros_activos: activeFilters })
+            body: JSON.stringify(buildFilterRequest(0))
         });
         const result = await response.json(); 
         if (!response.ok) throw new Error(result.error);
+        if (requestSeq !== filterRequestSeq) return; // Llegó una respuesta más nueva
 
-        currentData = result.data;
-        tableData = [...currentData];
+        currentData = rowsFromResponse(result);
+        totalRows = result.num_filas;
 
-        if (result.resumen) {
-            const totalFacturas = document.getElementById('resumen-total-facturas');
-            const montoTotal = document.getElementById('resumen-monto-total');
-            const montoPromedio = document.getElementById('resumen-monto-promedio');
-            if (totalFacturas) totalFacturas.textContent = result.resumen.total_facturas;
-            if (montoTotal) montoTotal.textContent = result.resumen.monto_total;
-            if (montoPromedio) montoPromedio.textContent = result.resumen.monto_promedio;
-        }
+        if (result.resumen) renderResumenCard(result.resumen);
 
-        applySort();
         renderFilters(); 
         renderTable();   
 
@@ -614,10 +761,43 @@ async function getFilteredData() {
     } catch (error) { 
         console.error('Error en fetch /api/filter:', error); 
         alert('Error al filtrar: ' + error.message);
+        renderFilters(); // Para poder quitar un filtro no válido
         resetResumenCard(); 
     }
 }
 
+/**
+ * Pide la siguiente página de /api/filter y la agrega al final de la tabla.
+ */
+async function loadNextPage() {
+    if (isLoadingPage || !currentFileId || currentData.length >= totalRows) return;
+    isLoadingPage = true;
+    const requestSeq = filterRequestSeq;
+    try {
+        const response = await fetch('/api/filter' + FORMATO_COLUMNAR, {
+            method: 'POST', headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(buildFilterRequest(currentData.length))
+        });
+        const result = await response.json();
+        if (!response.ok) throw new Error(result.error);
+        if (requestSeq !== filterRequestSeq) return; // Los filtros cambiaron mientras tanto
+
+        const tbody = document.querySelector('#results-table tbody');
+        const startIndex = currentData.length;
+        const rows = rowsFromResponse(result);
+        currentData.push(...rows);
+        totalRows = result.num_filas;
+        if (tbody) {
+            appendTableRows(tbody, rows, startIndex);
+            observeLastRow(tbody);
+        }
+    } catch (error) {
+        console.error('Error al cargar más filas de /api/filter:', error);
+    } finally {
+        isLoadingPage = false;
+    }
+}
+
 
 /**
  * LÓGICA DE VISTA 2: Pedir datos agrupados (del API)
@@ -636,7 +816,7 @@ async function getGroupedData() {
         const resultsDiv = document.getElementById('results-table-grouped');
         resultsDiv.innerHTML = `<p>Agrupando datos...</p>`;
 
-        const response = await fetch('/api/group_by', {
+        const response = await fetch('/api/group_by' + FORMATO_COLUMNAR, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ 
@@ -649,7 +829,7 @@ async function getGroupedData() {
         const result = await response.json();
         if (!response.ok) throw new Error(result.error);
         
-        renderGroupedTable(result.data, colAgrupar, false);
+        renderGroupedTable(rowsFromResponse(result), colAgrupar, false, result.columns || null);
         
         // --- ¡ARREGLO 1! Vuelve a dibujar los chips de filtros ---
         renderFilters(); 
@@ -742,7 +922,7 @@ async function handleGroupColumnChange() {
  * DIBUJADO 3: Dibuja la Tabla Agrupada
  * ¡ARREGLO 2 (BUG TABLA ROTA)!
  */
-function renderGroupedTable(data, colAgrupada, forceClear = false) {
+function renderGroupedTable(data, colAgrupada, forceClear = false, columns = null) {
     // --- ¡ARREGLO 2! Apunta al DIV de la vista agrupada ---
     const resultsTableDiv = document.getElementById('results-table-grouped');
     // --------------------------------------------------
@@ -767,16 +947,25 @@ function renderGroupedTable(data, colAgrupada, forceClear = false) {
     const thead = table.createTHead();
     const headerRow = thead.insertRow();
     
-    const headersMap = {
-        [colAgrupada]: (colAgrupada === '_row_status') ? "Row Status" : colAgrupada,
-        "Total_sum": i18n['group_total_amount'] || "Total Amount",
-        "Total_mean": i18n['group_avg_amount'] || "Avg Amount",
-        "Total_min": i18n['group_min_amount'] || "Min Amount",
-        "Total_max": i18n['group_max_amount'] || "Max Amount",
-        "Total_count": i18n['group_invoice_count'] || "Invoice Count"
+    // Las métricas llegan como '<columna de monto>_<métrica>' (ej. 'Total_sum', 'Monto_sum')
+    const metricLabels = {
+        "sum": i18n['group_total_amount'] || "Total Amount",
+        "mean": i18n['group_avg_amount'] || "Avg Amount",
+        "min": i18n['group_min_amount'] || "Min Amount",
+        "max": i18n['group_max_amount'] || "Max Amount",
+        "count": i18n['group_invoice_count'] || "Invoice Count"
     };
-    
-    const headerOrder = [colAgrupada, "Total_sum", "Total_mean", "Total_min", "Total_max", "Total_count"];
+    const metricOf = (key) => {
+        const metric = key.substring(key.lastIndexOf('_') + 1);
+        return (key.includes('_') && metricLabels[metric]) ? metric : null;
+    };
+
+    const headerOrder = columns || Object.keys(data[0]);
+    const headersMap = {};
+    headerOrder.forEach(key => {
+        const metric = (key === colAgrupada) ? null : metricOf(key);
+        headersMap[key] = metric ? metricLabels[metric] : ((key === '_row_status') ? "Row Status" : key);
+    });
 
     headerOrder.forEach(key => {
         if (headersMap[key]) { 
@@ -795,7 +984,8 @@ function renderGroupedTable(data, colAgrupada, forceClear = false) {
                 const cell = row.insertCell();
                 let valor = fila[key];
                 
-                if (key.startsWith('Total_') && key !== 'Total_count') {
+                const metric = (key === colAgrupada) ? null : metricOf(key);
+                if (metric && metric !== 'count') {
                     const numero = parseFloat(valor);
                     if (!isNaN(numero)) {
                         valor = numero.toFixed(2);